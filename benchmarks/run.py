@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+"""Benchmarks of scheduler and tree overhead, run with the Local job in a temporary directory.
+
+Usage:
+    python benchmarks/run.py [--sizes 1000 10000 100000] [--output result.json] [--compare baseline.json]
+"""
+from __future__ import annotations
+import sys
+import json
+import asyncio
+import platform
+import tempfile
+import typing as tp
+from os import chdir, path, devnull
+from time import perf_counter, time
+from fractions import Fraction
+from collections import deque
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+
+# use nnodes from this repository
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from nnodes import root, Node
+from nnodes.root import Root
+from nnodes.job import Local
+
+
+class Noop(Local):
+    """Local job that runs MPI tasks as plain shell commands."""
+    use_multiprocessing = False
+
+    def mpiexec(self, cmd: str, *_, **__):
+        return cmd
+
+
+def noop():
+    """Task that does nothing."""
+
+
+def timeit(func: tp.Callable[[], tp.Any], repeat: int = 3) -> float:
+    """Best time of several runs in seconds."""
+    best = float('inf')
+
+    for _ in range(repeat):
+        t = perf_counter()
+        func()
+        best = min(best, perf_counter() - t)
+
+    return best
+
+
+def build(n: int, fanout: int = 10):
+    """Replace the children of root with a tree of n nodes, half of them finished."""
+    root.reset()
+    now = time()
+    queue: tp.Deque[Node] = deque([root])
+    count = 1
+
+    while count < n:
+        parent = queue.popleft()
+
+        for _ in range(fanout):
+            if count >= n:
+                break
+
+            node = parent.add(noop, f'd{count}', concurrent=True, value=count)
+            queue.append(node)
+            count += 1
+
+            if count % 2:
+                node._starttime = now - 10
+                node._endtime = now
+
+    root._starttime = now - 10
+    root._endtime = now
+
+
+def bench_tree(sizes: tp.List[int]) -> dict:
+    """Tree construction, checkpoint, restart and stat rendering vs tree size."""
+    result = {}
+
+    for n in sizes:
+        repeat = 3 if n <= 100000 else 1
+        result[f'tree_build_{n}'] = timeit(lambda: build(n), repeat)
+
+        build(n)
+        result[f'checkpoint_{n}'] = timeit(root._dump, repeat)
+        result[f'restart_{n}'] = timeit(lambda: Root('.', {}, None).init(), repeat)
+        result[f'stat_{n}'] = timeit(lambda: root.stat(False), repeat)
+        result[f'stat_verbose_{n}'] = timeit(lambda: root.stat(True), repeat)
+
+    return result
+
+
+def bench_getattr(depths: tp.List[int], nlookups: int = 1000) -> dict:
+    """Cost of looking up a property defined in root from a node at given depth."""
+    result = {}
+
+    for depth in depths:
+        root.reset()
+        node: Node = root
+
+        for _ in range(depth):
+            node = node.add()
+
+        def lookup():
+            for _ in range(nlookups):
+                node.ping_interval
+
+        result[f'getattr_depth_{depth}'] = timeit(lookup) / nlookups
+
+    return result
+
+
+def bench_scheduler(ntasks: int) -> dict:
+    """Dispatch throughput of mpiexec with and without subprocess."""
+    from nnodes import mpiexec
+
+    result = {}
+
+    async def acquire_release():
+        # scheduler queue only, each task occupies 1 of 4 nodes
+        async def task():
+            fut = await mpiexec._acquire((Fraction(1), Fraction(1), Fraction(1)), 0)
+            await asyncio.sleep(0)
+            mpiexec._release(fut)
+
+        await asyncio.gather(*(task() for _ in range(ntasks)))
+
+    t = timeit(lambda: asyncio.run(acquire_release()))
+    result['scheduler_queue_tasks_per_second'] = ntasks / t
+
+    # no-op shell commands executed through mpiexec
+    nexec = min(ntasks, 200)
+    root.reset()
+    root._init['concurrent'] = True
+
+    for i in range(nexec):
+        root.add_mpi('true', name=f'noop{i}', cwd=f'noop{i}')
+
+    root._starttime = None
+    t = perf_counter()
+
+    # discard the status printed at the end of execution
+    with open(devnull, 'w') as f, redirect_stdout(f):
+        asyncio.run(root.execute())
+
+    result['mpiexec_tasks_per_second'] = nexec / (perf_counter() - t)
+
+    return result
+
+
+def compare(result: dict, baseline: dict, threshold: float):
+    """Print ratio of each benchmark to baseline."""
+    for key, val in result['results'].items():
+        if key not in baseline['results']:
+            continue
+
+        old = baseline['results'][key]
+
+        # higher is better for throughput
+        ratio = old / val if key.endswith('_per_second') else val / old
+        flag = '  (regression)' if ratio > threshold else ''
+        print(f'{key}: {ratio:.2f}x of baseline{flag}')
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark scheduler and tree overhead of nnodes.')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1000, 10000, 100000], help='tree sizes (up to 1000000)')
+    parser.add_argument('--depths', nargs='+', type=int, default=[1, 10, 100], help='node depths for getattr benchmark')
+    parser.add_argument('--ntasks', type=int, default=2000, help='number of tasks for scheduler benchmark')
+    parser.add_argument('--output', help='save result as JSON')
+    parser.add_argument('--compare', help='compare with a previous result')
+    parser.add_argument('--threshold', type=float, default=1.2, help='ratio to baseline reported as regression')
+    args = parser.parse_args()
+
+    cwd = path.abspath('.')
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        chdir(tmp)
+
+        # configuration of a local job, root.ping_interval is disabled so that execution exits immediately
+        root.dump({
+            'job': {'system': ['__main__', 'Noop'], 'nnodes': 4, 'walltime': 1e6, 'mp_nprocs_max': 4},
+            'root': {'task': ['__main__', 'noop'], 'ping_interval': 0, 'metrics_file': ''}
+        }, 'config.toml')
+        root.init()
+
+        results = {}
+        results.update(bench_getattr(args.depths))
+        results.update(bench_scheduler(args.ntasks))
+        results.update(bench_tree(args.sizes))
+
+        chdir(cwd)
+
+    result = {
+        'time': time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+
+    for key, val in results.items():
+        print(f'{key}: {val:.6g}')
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(result, json.load(f), args.threshold)
+
+
+if __name__ == '__main__':
+    main()
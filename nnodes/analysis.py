@@ -0,0 +1,176 @@
+from __future__ import annotations
+import typing as tp
+from datetime import timedelta
+
+if tp.TYPE_CHECKING:
+    from .node import Node
+
+
+def _fmt(seconds: float) -> str:
+    """Format time like node status."""
+    delta = str(timedelta(seconds=int(round(seconds))))
+
+    if delta.startswith('0:'):
+        delta = delta[2:]
+
+    return delta
+
+
+def finishtime(node: Node, cache: tp.Dict[Node, float | None] | None = None) -> float | None:
+    """Time when the task of a node and all its child nodes finished (None if node has not finished)."""
+    if cache is None:
+        cache = {}
+
+    # nodes to visit and whether their child nodes are already visited
+    stack: tp.List[tp.Tuple[Node, bool]] = [(node, False)]
+
+    while len(stack):
+        n, visited = stack.pop()
+
+        if n in cache:
+            continue
+
+        if n._endtime is None:
+            cache[n] = None
+
+        elif not visited:
+            # visit child nodes first
+            stack.append((n, True))
+            stack += [(child, False) for child in n]
+
+        else:
+            end = n._endtime
+
+            for child in n:
+                if (t := cache[child]) is not None:
+                    end = max(end, t)
+
+            cache[n] = end
+
+    return cache[node]
+
+
+def _timed(node: Node, cache: tp.Dict[Node, float | None]) -> tp.List[Node]:
+    """Child nodes with recorded start and end time."""
+    return [child for child in node if child._starttime and finishtime(child, cache) is not None]
+
+
+def critical_path(node: Node, cache: tp.Dict[Node, float | None] | None = None) -> tp.List[Node]:
+    """Chain of nodes that determined the total walltime of a node.
+
+    Child nodes of a sequential node all belong to the path.
+    For a concurrent node, only the child node that finished last belongs to the path.
+
+    Args:
+        node (Node): Root of the subtree to analyze.
+        cache (tp.Dict[Node, float | None] | None, optional): Cache of finish time. Defaults to None.
+
+    Returns:
+        tp.List[Node]: Nodes in the critical path in execution order.
+    """
+    if cache is None:
+        cache = {}
+
+    path: tp.List[Node] = []
+    stack = [node]
+
+    while len(stack):
+        n = stack.pop()
+        path.append(n)
+        children = _timed(n, cache)
+
+        if n.concurrent and len(children):
+            stack.append(max(children, key=lambda c: tp.cast(float, finishtime(c, cache))))
+
+        else:
+            stack += reversed(children)
+
+    return path
+
+
+def slack(node: Node, cache: tp.Dict[Node, float | None] | None = None) -> tp.Dict[Node, float]:
+    """Time each node could have been delayed without delaying the total walltime.
+
+    Args:
+        node (Node): Root of the subtree to analyze.
+        cache (tp.Dict[Node, float | None] | None, optional): Cache of finish time. Defaults to None.
+
+    Returns:
+        tp.Dict[Node, float]: Slack of each node (0 for nodes in the critical path).
+    """
+    if cache is None:
+        cache = {}
+
+    result: tp.Dict[Node, float] = {}
+    stack: tp.List[tp.Tuple[Node, float]] = [(node, 0.0)]
+
+    while len(stack):
+        n, s = stack.pop()
+        result[n] = s
+        children = _timed(n, cache)
+
+        if n.concurrent and len(children):
+            # concurrent nodes can be delayed until the last one finishes
+            end = max(tp.cast(float, finishtime(c, cache)) for c in children)
+            stack += [(c, s + end - tp.cast(float, finishtime(c, cache))) for c in children]
+
+        else:
+            stack += [(c, s) for c in children]
+
+    return result
+
+
+def report(node: Node, verbose: bool = False) -> str:
+    """Critical path and slack of nodes as text.
+
+    Args:
+        node (Node): Root of the subtree to analyze.
+        verbose (bool, optional): Also list the slack of each node. Defaults to False.
+
+    Returns:
+        str: Report of the critical path.
+    """
+    cache: tp.Dict[Node, float | None] = {}
+
+    if not node._starttime or (end := finishtime(node, cache)) is None:
+        return f'{node.name} has not finished'
+
+    path = critical_path(node, cache)
+    slacks = slack(node, cache)
+    onpath = set(path)
+
+    # depth of each node relative to node
+    depth: tp.Dict[Node, int] = {node: 0}
+    stack = [node]
+
+    while len(stack):
+        n = stack.pop()
+
+        for child in n:
+            depth[child] = depth[n] + 1
+            stack.append(child)
+
+    lines = [f'critical path ({_fmt(end - node._starttime)}), task time (queue wait) of each node:']
+
+    for n in path:
+        # walltime of the task itself and time waiting for MPI resource
+        task = tp.cast(float, n._endtime) - tp.cast(float, n._starttime)
+        wait = (n._dispatchtime - tp.cast(float, n._starttime)) if n._dispatchtime else 0.0
+        line = '  ' * (depth[n] + 1) + f'{n.name} {_fmt(task)}'
+
+        if wait > 0:
+            line += f' ({_fmt(wait)})'
+
+        lines.append(line)
+
+    if verbose:
+        lines.append('slack of each node (* for nodes in the critical path):')
+        stack = [node]
+
+        while len(stack):
+            n = stack.pop()
+            mark = '*' if n in onpath else ' '
+            lines.append(f'{mark} ' + '  ' * depth[n] + f'{n.name} {_fmt(slacks[n])}')
+            stack += reversed(_timed(n, cache))
+
+    return '\n'.join(lines)
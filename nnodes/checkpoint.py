@@ -0,0 +1,484 @@
+from __future__ import annotations
+import pickle
+import typing as tp
+from array import array
+
+from .node import Node
+
+if tp.TYPE_CHECKING:
+    from .root import Root
+
+
+# version of the checkpoint format, increase when the layout of capture() changes
+VERSION = 1
+
+# node flags
+IS_MPI = 1
+CANCELLED = 2
+FAILED = 4
+NAMED = 8
+CONCURRENT = 16
+DONE = 32
+
+# types that are saved without pickling the object separately
+_plain_types = (bool, int, float, str, type(None))
+
+# placeholder of a value that is stored in the pickled payload of a node (see expand())
+_pending = ...
+
+# arrays of node properties and their type codes
+_arrays = {
+    'parent': 'l', 'size': 'l', 'name': 'l', 'cwd': 'l', 'flags': 'B',
+    'starttime': 'd', 'dispatchtime': 'd', 'endtime': 'd', 'elapsed': 'd'
+}
+
+
+def _plain(val: tp.Any) -> bool:
+    """Whether a value consists only of built-in types."""
+    if type(val) in _plain_types:
+        return True
+
+    if type(val) in (list, tuple):
+        return all(_plain(v) for v in val)
+
+    if type(val) is dict:
+        return all(type(k) is str and _plain(v) for k, v in val.items())
+
+    return False
+
+
+def _split(items: dict, key: str, blob: dict) -> dict:
+    """Copy of items with non-plain values moved to blob."""
+    plain = {}
+
+    for k, v in items.items():
+        if _plain(v):
+            plain[k] = v
+
+        else:
+            plain[k] = _pending
+            blob[key, k] = v
+
+    return plain
+
+
+def _prefix(cwd: str) -> str:
+    """Prefix of the directories of child nodes."""
+    return '' if cwd == '.' else cwd + '/'
+
+
+def _time(t: float) -> float | None:
+    """Convert NaN back to None."""
+    return None if t != t else t
+
+
+def _summarize(state: dict):
+    """Compute subtree size, whether subtree is done and total walltime of each node (same as node.done and node.elapsed)."""
+    parent = state['parent']
+    flags = state['flags']
+    starttime = state['starttime']
+    dispatchtime = state['dispatchtime']
+    endtime = state['endtime']
+    n = len(parent)
+    size = state['size'] = array('l', [1]) * n
+    elapsed = state['elapsed'] = array('d', [float('nan')]) * n
+
+    # whether any child node is not done, sum and max of total walltime of child nodes
+    pending = [False] * n
+    total = [0.0] * n
+    longest = [0.0] * n
+    count = [0] * n
+
+    # summary of nodes whose child nodes are archived
+    archived = state.get('archived', {})
+
+    # child nodes are visited before their parents
+    for i in range(n - 1, -1, -1):
+        f = flags[i]
+        start = starttime[i]
+        end = endtime[i]
+        delta = end - (start if dispatchtime[i] != dispatchtime[i] else dispatchtime[i])
+        done = True
+
+        if f & CANCELLED:
+            elapsed[i] = delta if delta == delta else 0.0
+
+        elif i in archived:
+            elapsed[i] = archived[i]['elapsed']
+
+        elif end == end and not pending[i]:
+            elapsed[i] = delta + (longest[i] if f & CONCURRENT and count[i] > 1 else total[i])
+
+        else:
+            done = False
+
+        flags[i] = f | DONE if done else f & ~DONE
+
+        if (p := parent[i]) >= 0:
+            size[p] += size[i]
+
+            if done:
+                total[p] += elapsed[i]
+                longest[p] = max(longest[p], elapsed[i])
+                count[p] += 1
+
+            else:
+                pending[p] = True
+
+
+def snapshot(root: Node) -> tp.List[tuple]:
+    """Copy the properties of nodes in a tree so that they can be serialized in another thread.
+
+    Only the structure of the tree and the dicts of node data are copied (the values are not),
+    so this function is cheap enough to run in the event loop thread. Values of node data are pickled
+    in the saving thread, so a mutable value (e.g. a list) must be replaced rather than modified in place,
+    otherwise the checkpoint may contain a partially modified value.
+
+    Args:
+        root (Node): Root node of the tree.
+
+    Returns:
+        tp.List[tuple]: Properties of nodes in depth-first order that can be passed to serialize().
+    """
+    nodes: tp.List[tuple] = []
+    stack: tp.List[tp.Tuple[Node, int]] = [(root, -1)]
+
+    while len(stack):
+        node, p = stack.pop()
+        i = len(nodes)
+        blob = node._blob
+
+        # names are saved so that node status can be shown without loading tasks
+        flags = (node._flags & NAMED if blob is not None else NAMED if node._name is not None else 0) | \
+            (IS_MPI if node._is_mpi else 0) | (CANCELLED if node._cancelled else 0) | \
+            (FAILED if node._err is not None else 0) | (CONCURRENT if node.concurrent else 0)
+
+        nodes.append((p, node._cwd, node.name, node._starttime, node._dispatchtime, node._endtime, flags,
+            node._init.copy(), node._data.copy(), node._err, blob, node._archived, node._lazy, node._probed))
+
+        if node._lazy is None:
+            stack += ((child, i) for child in reversed(node._children))
+
+    return nodes
+
+
+def serialize(nodes: tp.List[tuple]) -> dict:
+    """Convert a snapshot of a tree to arrays of node properties.
+
+    Nodes are stored in depth-first order, so that a subtree is a contiguous range of nodes.
+    Names and directories are interned in a string table, timestamps and flags are stored as arrays.
+    Node data with only built-in types are pickled for each node, other values (e.g. tasks, exceptions and
+    user objects) are pickled separately, so that they are only unpickled when they are accessed.
+
+    Args:
+        nodes (tp.List[tuple]): Snapshot returned by snapshot().
+
+    Returns:
+        dict: State that can be restored with restore().
+    """
+    strings: tp.List[str] = []
+    index: tp.Dict[str, int] = {}
+
+    def intern(s: str) -> int:
+        if s not in index:
+            index[s] = len(strings)
+            strings.append(s)
+
+        return index[s]
+
+    nan = float('nan')
+    state: tp.Dict[str, tp.Any] = {key: array(code) for key, code in _arrays.items()}
+    parent = state['parent']
+    name = state['name']
+    cwd = state['cwd']
+    flags = state['flags']
+    starttime = state['starttime']
+    dispatchtime = state['dispatchtime']
+    endtime = state['endtime']
+    meta: tp.List[bytes] = []
+    blobs: tp.List[bytes | None] = []
+    archived: tp.Dict[int, dict] = {}
+    probed: tp.Dict[int, float | str] = {}
+
+    # index of nodes in the snapshot in the saved state (different if nodes are copied from a previous state)
+    indices: tp.List[int] = []
+    cwds: tp.List[str] = []
+
+    for p, d, n, start, dispatch, end, f, init, data, err, blob, record, lazy, value in nodes:
+        i = len(parent)
+        p = indices[p] if p >= 0 else -1
+        indices.append(i)
+        parent.append(p)
+        cwds.append(d)
+
+        # directory relative to parent directory (negative index for directories outside of parent directory)
+        if p < 0:
+            cwd.append(-1 - intern(d))
+
+        elif d == cwds[p]:
+            cwd.append(intern(''))
+
+        elif d.startswith(prefix := _prefix(cwds[p])):
+            cwd.append(intern(d[len(prefix):]))
+
+        else:
+            cwd.append(-1 - intern(d))
+
+        starttime.append(nan if start is None else start)
+        dispatchtime.append(nan if dispatch is None else dispatch)
+        endtime.append(nan if end is None else end)
+        name.append(intern(n))
+        flags.append(f)
+
+        if blob is not None:
+            # node data is not loaded since last restore, reuse previous payload
+            meta.append(pickle.dumps((init, data), pickle.HIGHEST_PROTOCOL))
+            blobs.append(blob)
+
+        else:
+            items: tp.Dict[tp.Tuple[str, str], tp.Any] = {}
+            meta.append(pickle.dumps((_split(init, 'init', items), _split(data, 'data', items)),
+                pickle.HIGHEST_PROTOCOL))
+
+            if err is not None:
+                items['err', ''] = err
+
+            blobs.append(pickle.dumps(items, pickle.HIGHEST_PROTOCOL) if len(items) else None)
+
+        if record is not None:
+            archived[i] = record
+
+        if value is not None:
+            probed[i] = value
+
+        if lazy is not None:
+            # copy child nodes that are not loaded since last restore
+            src, j = lazy
+            sstrings = src['strings']
+
+            for k, record in src.get('archived', {}).items():
+                if j < k < j + src['size'][j]:
+                    archived[k - j + i] = record
+
+            for k in range(j + 1, j + src['size'][j]):
+                parent.append(src['parent'][k] - j + i)
+                name.append(intern(sstrings[src['name'][k]]))
+                c = src['cwd'][k]
+                cwd.append(-1 - intern(sstrings[-1 - c]) if c < 0 else intern(sstrings[c]))
+
+                for key in ('flags', 'starttime', 'dispatchtime', 'endtime'):
+                    state[key].append(src[key][k])
+
+                meta.append(src['meta'][k])
+                blobs.append(src['blobs'][k])
+
+                # directories of copied nodes are not needed because their child nodes are copied as well
+                cwds.append('')
+
+    state['version'] = VERSION
+    state['strings'] = strings
+    state['meta'] = meta
+    state['blobs'] = blobs
+    state['archived'] = archived
+    state['probed'] = probed
+    _summarize(state)
+
+    return state
+
+
+def capture(root: Node) -> dict:
+    """Save the state of a tree as arrays of node properties (see serialize()).
+
+    Args:
+        root (Node): Root node of the tree.
+
+    Returns:
+        dict: State that can be restored with restore().
+    """
+    return serialize(snapshot(root))
+
+
+def restore(root: Root, state: dict):
+    """Restore the state of a tree saved by capture() or a root.pickle of previous versions.
+
+    Child nodes of finished nodes are not restored until they are accessed (see load_children()).
+
+    Args:
+        root (Root): Root node to restore into.
+        state (dict): Saved state.
+    """
+    if 'version' not in state:
+        _migrate(root, state)
+        return
+
+    if state['version'] > VERSION:
+        raise ValueError(f'checkpoint version {state["version"]} is not supported by this version of nnodes')
+
+    _restore(root, state, 0, None)
+    _build(root, state, 0)
+
+
+def _restore(node: Node, state: dict, i: int, pnode: Node | None):
+    """Restore the properties of a node."""
+    strings = state['strings']
+    c = state['cwd'][i]
+    f = state['flags'][i]
+    blob = state['blobs'][i]
+    init, data = pickle.loads(state['meta'][i])
+    start = state['starttime'][i]
+    dispatch = state['dispatchtime'][i]
+    end = state['endtime'][i]
+
+    if c < 0:
+        d = strings[-1 - c]
+
+    elif strings[c]:
+        d = _prefix(tp.cast(Node, pnode)._cwd) + strings[c]
+
+    else:
+        d = tp.cast(Node, pnode)._cwd
+
+    # bypass Node.__setattr__ for faster restore
+    node.__dict__.update({
+        '_cwd': d,
+        '_init': init,
+        '_data': data,
+        '_parent': pnode,
+        '_children': [],
+        '_starttime': None if start != start else start,
+        '_dispatchtime': None if dispatch != dispatch else dispatch,
+        '_endtime': None if end != end else end,
+        '_name': strings[state['name'][i]] if f & NAMED or blob is not None else None,
+        '_is_mpi': bool(f & IS_MPI),
+        '_cancelled': bool(f & CANCELLED),
+        '_blob': blob,
+        '_flags': f,
+        '_archived': state.get('archived', {}).get(i),
+        '_probed': state.get('probed', {}).get(i)
+    })
+
+    if pnode is None or f & FAILED:
+        # exception is needed to determine node status and job state
+        try:
+            expand(node)
+
+        except Exception as e:
+            # task or exception cannot be imported, keep the payload so that the error is raised when accessed
+            if f & FAILED:
+                node.__dict__['_err'] = e
+
+
+def _build(node: Node, state: dict, i: int):
+    """Restore the child nodes of a node, child nodes of finished nodes are restored when accessed."""
+    size = state['size']
+    flags = state['flags']
+    new = Node.__new__
+    stack = [(node, i)]
+    node.__dict__['_children'] = []
+
+    while len(stack):
+        node, i = stack.pop()
+        children = node._children
+        j = i + 1
+        end = i + size[i]
+
+        while j < end:
+            child = new(Node)
+            _restore(child, state, j, node)
+            children.append(child)
+
+            if flags[j] & DONE and size[j] > 1:
+                del child.__dict__['_children']
+                child._lazy = (state, j)
+
+            else:
+                stack.append((child, j))
+
+            j += size[j]
+
+
+def archive(node: Node, dst: str):
+    """Save the child nodes of a node to a file and replace them with a summary."""
+    state = capture(node)
+    flags = state['flags']
+    nested = state['archived'].values()
+
+    node._archived = {
+        'file': dst,
+        'elapsed': node.elapsed,
+        'nodes': len(flags) - 1 + sum(r['nodes'] for r in nested),
+        'failed': sum(1 for f in flags[1:] if f & FAILED) + sum(r['failed'] for r in nested),
+        'cancelled': sum(1 for f in flags[1:] if f & CANCELLED) + sum(r['cancelled'] for r in nested)
+    }
+
+    node.dump(state, dst)
+    node._lazy = None
+    node._children = []
+
+
+def unarchive(node: Node):
+    """Restore the child nodes of a node from its archive file."""
+    if node._archived is None:
+        return
+
+    state = node.load(node._archived['file'])
+    node._archived = None
+    node._lazy = None
+    _build(node, state, 0)
+
+
+def load_children(node: Node):
+    """Restore the child nodes of a finished node."""
+    if node._lazy is not None:
+        state, i = node._lazy
+        node._lazy = None
+        _build(node, state, i)
+
+
+def getelapsed(node: Node) -> float | None:
+    """Total walltime of a finished node whose child nodes are not restored."""
+    state, i = tp.cast(tp.Tuple[dict, int], node._lazy)
+    return _time(state['elapsed'][i])
+
+
+def expand(node: Node):
+    """Unpickle the node data that are not loaded by restore()."""
+    blob = node._blob
+
+    if blob is None:
+        return
+
+    # payload is kept if it cannot be unpickled
+    loaded = pickle.loads(blob)
+    node._blob = None
+
+    # loaded values are not changes to the tree (see nnodes.node.touch)
+    if not node._flags & NAMED:
+        # name was resolved from task when saved
+        node.__dict__['_name'] = None
+
+    for (key, k), v in loaded.items():
+        if key == 'err':
+            node.__dict__['_err'] = v
+
+        else:
+            # skip items that are removed or changed after restore
+            items = node._init if key == 'init' else node._data
+
+            if k in items and items[k] is _pending:
+                items[k] = v
+
+
+def _migrate(root: Root, state: dict):
+    """Restore from root.pickle that pickled node objects directly."""
+    root.__setstate__(state)
+
+    # child nodes of root referred to a copy of root created when pickling
+    stack: tp.List[Node] = [root]
+
+    while len(stack):
+        node = stack.pop()
+
+        for child in node._children:
+            child._parent = node
+            stack.append(child)
@@ -1,17 +1,32 @@
 from __future__ import annotations
 
-from os import path, fsync
+from os import path, fsync, killpg
 from subprocess import check_call
+from signal import SIGTERM
 from glob import glob
 import pickle
 import toml
 import typing as tp
 
 
+if tp.TYPE_CHECKING:
+    from asyncio.subprocess import Process
+
+
 # supported types for directory.load() and directory.dump()
 DumpType = tp.Literal['pickle', 'npy', 'toml', 'json', None]
 
 
+def terminate(process: Process):
+    """Terminate a subprocess created with start_new_session=True and its child processes."""
+    if process.returncode is None:
+        try:
+            killpg(process.pid, SIGTERM)
+
+        except ProcessLookupError:
+            pass
+
+
 class Directory:
     """Directory related operations."""
     # relative path
@@ -268,9 +283,16 @@ class Directory:
         Args:
             cmd (str): Shell command.
         """
-        from asyncio import create_subprocess_shell
-        process = await create_subprocess_shell(cmd, cwd=self.cwd)
-        await process.communicate()
+        from asyncio import create_subprocess_shell, CancelledError
+        process = await create_subprocess_shell(cmd, cwd=self.cwd, start_new_session=True)
+
+        try:
+            await process.communicate()
+
+        except CancelledError:
+            # terminate subprocess if the task is cancelled
+            terminate(process)
+            raise
 
         # And check whether returncode is 0
         if process.returncode != 0:
@@ -1,8 +1,8 @@
 import typing as tp
 import math
 from time import time
-from os import path, environ
-from subprocess import check_call
+from os import path, environ, _exit
+from subprocess import check_call, check_output
 
 
 class Job:
@@ -31,6 +31,15 @@ class Job:
     # avoid calling new MPI tasks if remaining walltime is less than certain minutes
     gap: float = 0.0
 
+    # stop starting new MPI tasks certain minutes before remaining walltime runs out,
+    # then requeue after running tasks finish instead of killing them
+    drain: float = 0.0
+
+    # quantile of the runtimes of finished tasks with the same name (numbers ignored) that must fit into remaining walltime,
+    # otherwise the task is left to the next job, which is requeued once no other task can be admitted
+    # (only for MPI tasks with timeout='auto'), None to disable
+    admission_quantile: float | None = None
+
     # arbitary arguments added after mpiexec
     exec_args: str | None = None
 
@@ -40,6 +49,9 @@ class Job:
     # number of GPUs per node (if is None, the value must exist in config.toml)
     gpus_per_node: int
 
+    # memory per node in MB (if is None, memory is not considered when scheduling MPI tasks)
+    memory_per_node: float | None = None
+
     # whether a node can run multiple MPI tasks
     node_splittable = False
 
@@ -49,12 +61,30 @@ class Job:
     # maximum number of processes spawned with multiprocessing
     mp_nprocs_max: int = 20
 
+    # number of nodes of each worker allocation in pilot mode (requires root.lease_dir), set to None to disable
+    pilot_nnodes: int | None = None
+
+    # maximum number of worker allocations in pilot mode
+    pilot_max: int = 4
+
+    # walltime of worker allocations in minutes (if is None, the walltime of current job is used)
+    pilot_walltime: float | None = None
+
+    # a worker allocation without tasks to execute is released after certain minutes
+    pilot_idle: float = 5.0
+
     # execution start time
     _exec_start: float
 
     # job is being requeued
     _signaled = False
 
+    # job stopped starting new MPI tasks and is requeued after running tasks finish
+    _draining = False
+
+    # some MPI tasks are left to the next job because they are unlikely to finish within the remaining walltime
+    _deferred = False
+
     # job state
     _state: tp.List[bool]
 
@@ -95,6 +125,11 @@ class Job:
         """Remaining walltime in minutes."""
         return self.walltime - self.gap - (time() - self._exec_start) / 60
 
+    @property
+    def until_drain(self) -> float:
+        """Remaining walltime in minutes before new MPI tasks are no longer started."""
+        return self.remaining - self.drain
+
     def write(self, cmd: str, dst: str):
         """Write job submission script to target directory."""
         from  .root import root
@@ -104,8 +139,16 @@ class Job:
     def requeue(self):
         """Resubmit current job."""
 
+    def submit(self, cmd: str, nnodes: int, walltime: float, name: str) -> str:
+        """Submit a new job that runs a command (used by pilot mode), returns the job id."""
+        raise NotImplementedError(f'job submission is not implemented ({cmd})')
+
+    def cancel(self, jobid: str):
+        """Cancel a job submitted by submit()."""
+        raise NotImplementedError(f'job cancellation is not implemented ({jobid})')
+
     def mpiexec(self, cmd: str, nprocs: int, cpus_per_proc: int = 1, gpus_per_proc: int = 0,
-        mps: int | None = None, args: str | None = None) -> str:
+        mps: int | None = None, args: str | None = None, *, memory_per_proc: float | None = None) -> str:
         """Returns the command to run an MPI task."""
         raise NotImplementedError(f'mpiexec is not implemented ({cmd})')
 
@@ -202,8 +245,35 @@ class LSF(Job):
         """Run current job again."""
         check_call('brequeue ' + environ['LSB_JOBID'], shell=True)
 
+    def submit(self, cmd, nnodes, walltime, name):
+        """Submit a job with bsub."""
+        import re
+
+        # hours and minutes
+        hh = int(walltime // 60)
+        mm = int(walltime - hh * 60)
+
+        cmds = [f'bsub -J {name} -W {hh:02d}:{mm:02d} -nnodes {nnodes} -o lsf.%J.o -e lsf.%J.e -alloc_flags "gpumps"']
+
+        if self.account:
+            cmds.append(f'-P {self.account}')
+
+        if self.debug:
+            cmds.append('-q debug')
+
+        cmds.append(f"'{cmd}'")
+
+        # output is "Job <jobid> is submitted to queue <queue>."
+        out = check_output(' '.join(cmds), shell=True).decode()
+
+        return tp.cast(re.Match, re.search(r'<(\d+)>', out)).group(1)
+
+    def cancel(self, jobid):
+        """Cancel a job with bkill."""
+        check_call(f'bkill {jobid}', shell=True)
+
     def mpiexec(self, cmd: str, nprocs: int, cpus_per_proc: int = 1, gpus_per_proc: int = 0,
-        mps: int | None = None, args: str | None = None):
+        mps: int | None = None, args: str | None = None, *, memory_per_proc: float | None = None):
         """Get the command to call MPI."""
         cmds = ['jsrun']
 
@@ -229,6 +299,10 @@ class LSF(Job):
 
         cmds.append(f'-n {nprocs} -a {a} -c {cpus_per_proc} -g {gpus_per_proc}')
 
+        if memory_per_proc:
+            # memory of a resource set in MB
+            cmds.append(f'--memory_per_rs {int(math.ceil(memory_per_proc * a))}')
+
         if args is not None:
             cmds.append(args)
 
@@ -259,11 +333,35 @@ class Slurm(Job):
         """Run current job again."""
         check_call('scontrol requeue ' + environ['SLURM_JOB_ID'], shell=True)
 
+    def submit(self, cmd, nnodes, walltime, name):
+        """Submit a job with sbatch."""
+        # hours and minutes
+        hh = int(walltime // 60)
+        mm = int(walltime - hh * 60)
+
+        cmds = [f'sbatch --parsable -J {name} -t {hh:02d}:{mm:02d}:00 -N {nnodes} -o slurm.%J.o -e slurm.%J.e']
+
+        if self.account:
+            cmds.append(f'-A {self.account}')
+
+        cmds.append(f"--wrap '{cmd}'")
+
+        # output is "jobid" or "jobid;cluster"
+        return check_output(' '.join(cmds), shell=True).decode().strip().split(';')[0]
+
+    def cancel(self, jobid):
+        """Cancel a job with scancel."""
+        check_call(f'scancel {jobid}', shell=True)
+
     def mpiexec(self, cmd: str, nprocs: int, cpus_per_proc: int = 1, gpus_per_proc: int = 0,
-        mps: int | None = None, args: str | None = None):
+        mps: int | None = None, args: str | None = None, *, memory_per_proc: float | None = None):
         """Get the command to call MPI."""
         cmds = [f'srun -n {nprocs} --cpus-per-task  {cpus_per_proc} --gpus-per-task {gpus_per_proc}']
 
+        if memory_per_proc:
+            # memory of a CPU in MB
+            cmds.append(f'--mem-per-cpu {int(math.ceil(memory_per_proc / cpus_per_proc))}')
+
         if args is not None:
             cmds.append(args)
 
@@ -340,10 +438,18 @@ class Andes(Slurm):
     # number of GPUs per node
     gpus_per_node = 0
 
-    def mpiexec(self, cmd: str, nprocs: int, cpus_per_proc: int = 1,
-                *args, **kwargs):
+    def mpiexec(self, cmd: str, nprocs: int, cpus_per_proc: int = 1, gpus_per_proc: int = 0,
+        mps: int | None = None, args: str | None = None, *, memory_per_proc: float | None = None):
         """Get the command to call MPI."""
-        return  f'srun -n {nprocs} -c {cpus_per_proc} --exclusive --cpu-bind=cores {cmd}'
+        cmds = [f'srun -n {nprocs} -c {cpus_per_proc} --exclusive --cpu-bind=cores']
+
+        if memory_per_proc:
+            # memory of a CPU in MB
+            cmds.append(f'--mem-per-cpu {int(math.ceil(memory_per_proc / cpus_per_proc))}')
+
+        cmds.append(cmd)
+
+        return ' '.join(cmds)
 
 
 class Traverse(Slurm):
@@ -357,8 +463,8 @@ class Traverse(Slurm):
     # number of GPUs per node
     gpus_per_node = 4
 
-    def mpiexec(self, cmd: str, nprocs: int, cpus_per_proc: int = 1,
-                gpus_per_proc: int = 0, mps: int | None = None):
+    def mpiexec(self, cmd: str, nprocs: int, cpus_per_proc: int = 1, gpus_per_proc: int = 0,
+        mps: int | None = None, args: str | None = None, *, memory_per_proc: float | None = None):
         """Get the command to call MPI."""
 
         if mps is not None:
@@ -367,6 +473,10 @@ class Traverse(Slurm):
         else:
             gpu_opts = f"--gpus-per-task {gpus_per_proc}"
 
+        if memory_per_proc:
+            # memory of a CPU in MB
+            gpu_opts += f' --mem-per-cpu {int(math.ceil(memory_per_proc / cpus_per_proc))}'
+
         return  f'srun -n {nprocs} {gpu_opts} {cmd}'
 
 
@@ -397,6 +507,107 @@ class Local(Job):
     # replace MPI tasks with multiprocessing
     use_multiprocessing = True
 
+    def submit(self, cmd, nnodes, walltime, name):
+        """Run the command in a background process as a fake scheduler for testing pilot mode."""
+        from subprocess import Popen
+
+        return str(Popen(cmd, shell=True, start_new_session=True).pid)
+
+    def cancel(self, jobid):
+        """Stop a process started by submit()."""
+        import signal
+        from os import killpg
+
+        try:
+            killpg(int(jobid), signal.SIGTERM)
+
+        except ProcessLookupError:
+            pass
+
+
+class Simulated(Job):
+    """Simulated cluster that replaces MPI tasks with sleeps for testing scheduling behaviour."""
+    nnmk_name = 'Simulated cluster'
+
+    # simulated time runs faster than real time by this factor (walltime, gap and task durations are simulated)
+    speedup: float = 1000.0
+
+    # duration of MPI tasks in seconds, keys are matched against the command (e.g. task name or function name)
+    durations: tp.Dict[str, float] = {}
+
+    # duration of MPI tasks that match no key in durations
+    default_duration: float = 60.0
+
+    # trace file of a previous run (see root.trace_file) to replay task durations from
+    replay: str | None = None
+
+    # maximum number of requeues before the simulated job stops
+    max_requeue: int = 10
+
+    @property
+    def inqueue(self):
+        return True
+
+    @property
+    def remaining(self) -> float:
+        """Remaining walltime in real minutes."""
+        return (self.walltime - self.gap) / self.speedup - (time() - self._exec_start) / 60
+
+    @property
+    def until_drain(self) -> float:
+        """Remaining real minutes before new MPI tasks are no longer started."""
+        return self.remaining - self.drain / self.speedup
+
+    def __init__(self, job: dict, state: list):
+        super().__init__(job, state)
+
+        if self.replay:
+            from .trace import load, _intervals
+
+            # average duration of tasks with the same name
+            total: tp.Dict[str, tp.List[float]] = {}
+
+            for e1, e2 in _intervals(load(self.replay), 'dispatch', ('release',)):
+                entry = total.setdefault(e1['name'], [0.0, 0])
+                entry[0] += e2['t'] - e1['t']
+                entry[1] += 1
+
+            self.durations = {**{key: val[0] / val[1] for key, val in total.items()}, **self.durations}
+
+    def requeue(self):
+        """Run current job again after current process exits."""
+        import atexit
+
+        n = int(environ.get('NNODES_REQUEUE', 0))
+
+        if n >= self.max_requeue:
+            print(f'simulated job reached max_requeue ({self.max_requeue})')
+            return
+
+        if self._signaled:
+            # scheduler kills the job due to insufficient walltime (state is already saved)
+            _exit(self._relaunch(n + 1))
+
+        atexit.register(self._relaunch, n + 1)
+
+    def _relaunch(self, n: int) -> int:
+        """Start a new process that continues the workflow."""
+        import sys
+        from subprocess import call
+
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        return call([sys.executable, '-c', 'from nnodes import root; root.run()'], env={**environ, 'NNODES_REQUEUE': str(n)})
+
+    def mpiexec(self, cmd: str, *_, **__):
+        """Sleep for the (scaled) duration of the task instead of running it."""
+        # use the longest key that matches the command
+        keys = [key for key in self.durations if key in cmd]
+        duration = self.durations[max(keys, key=len)] if len(keys) else self.default_duration
+
+        return f'sleep {duration / self.speedup:.6f}'
+
 
 class LocalMPI(Local):
     """Local computer with MPI installed."""
@@ -404,6 +615,9 @@ class LocalMPI(Local):
 
     use_multiprocessing = False
 
-    def mpiexec(self, cmd: str, nprocs: int, *_):
+    def mpiexec(self, cmd: str, nprocs: int, *_, memory_per_proc: float | None = None):
         """Get the command to call MPI."""
+        if memory_per_proc:
+            raise ValueError('memory_per_proc is not supported by LocalMPI (mpiexec cannot limit the memory of a process)')
+
         return f'$(which mpiexec) -n {nprocs} {cmd}'
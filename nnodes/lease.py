@@ -0,0 +1,439 @@
+from __future__ import annotations
+import pickle
+import asyncio
+import typing as tp
+from os import path, rename, remove, replace, utime, listdir, makedirs, getpid, environ
+from time import time
+from socket import gethostname
+from datetime import timedelta
+
+from .root import root
+from .directory import Directory, terminate
+
+if tp.TYPE_CHECKING:
+    from .mpiexec import Resource
+
+
+# subdirectories of root.lease_dir: task commands, tasks waiting for a job, tasks claimed by a job,
+# results of finished tasks, tasks cancelled while being executed and liveness of pilot allocations
+_subdirs = ('tasks', 'pending', 'leased', 'done', 'cancelled', 'pilots')
+
+# tasks submitted from this process waiting for results,
+# task id -> (future, node, whether task is dispatched, resource, submission time)
+_waiting: tp.Dict[str, tp.List[tp.Any]] = {}
+
+# background tasks polling for results and executing tasks in the workflow process
+_background: tp.List[asyncio.Task] = []
+
+# number of tasks submitted from this process
+_nsubmitted = 0
+
+# interval (in seconds) of checking root.lease_dir
+_poll_interval = 1.0
+
+# name of current job in task ids and results
+_worker = f'{gethostname()}.{getpid()}'
+
+# number of tasks claimed by current job
+_nclaimed = 0
+
+# leases observed by _poll, lease file name -> (mtime, local time when the mtime was first observed)
+# (expiry is measured with the local clock so that clocks of other hosts do not need to be synchronized)
+_renewals: tp.Dict[str, tp.Tuple[float, float]] = {}
+
+
+def _path(*paths: str) -> str:
+    """Path of a file in root.lease_dir."""
+    return root.path(tp.cast(str, root.lease_dir), *paths)
+
+
+def _ls(sub: str) -> tp.List[str]:
+    """Task ids in a subdirectory of root.lease_dir."""
+    try:
+        return [tid for tid in listdir(_path(sub)) if not tid.endswith('.tmp')]
+
+    except FileNotFoundError:
+        return []
+
+
+def _dump(obj: tp.Any, dst: str):
+    """Write a pickle file that is replaced atomically."""
+    with open(dst + '.tmp', 'wb') as f:
+        pickle.dump(obj, f)
+
+    replace(dst + '.tmp', dst)
+
+
+def _load(src: str) -> tp.Any:
+    """Read a pickle file."""
+    with open(src, 'rb') as f:
+        return pickle.load(f)
+
+
+def _touch(dst: str):
+    """Create an empty file."""
+    open(dst, 'w').close()
+
+
+def _fits(res: Resource) -> bool:
+    """Whether a task fits into current job."""
+    if isinstance(res, int):
+        return res <= root.job.mp_nprocs_max
+
+    return all(r <= root.job.nnodes for r in res)
+
+
+def start():
+    """Clear root.lease_dir and start sharing MPI tasks with other jobs (called from Root.execute)."""
+    if not root.lease_dir or len(_background):
+        return
+
+    # leases of a previous run are invalid
+    root.rm(root.lease_dir)
+
+    for sub in _subdirs:
+        makedirs(_path(sub), exist_ok=True)
+
+    _background.append(asyncio.create_task(_poll()))
+    _background.append(asyncio.create_task(work()))
+
+
+def stop():
+    """Stop sharing tasks and notify other jobs that the workflow is finished."""
+    if len(_background):
+        for task in _background:
+            task.cancel()
+
+        _background.clear()
+        _touch(_path('closed'))
+
+
+async def submit(d: Directory, spec: dict) -> tp.Tuple[int | None, bool]:
+    """Add an MPI task to root.lease_dir and wait until it is executed by any job sharing the directory.
+
+    Args:
+        d (Directory): Node of the task.
+        spec (dict): Command, file name, resource, priority and timeout of the task (see nnodes.mpiexec.mpiexec).
+
+    Returns:
+        tp.Tuple[int | None, bool]: Exit code of the task and whether the task timed out.
+    """
+    from .trace import emit
+    from .mpiexec import getresource
+
+    global _nsubmitted
+
+    _nsubmitted += 1
+    tid = f'{_worker}.{_nsubmitted}'
+    fut = asyncio.get_running_loop().create_future()
+    res = getresource(spec['nprocs'], spec['cpus_per_proc'], spec['gpus_per_proc'], spec['mps'],
+        spec['memory_per_proc'], spec['use_multiprocessing'])
+    _waiting[tid] = [fut, d, False, res, time()]
+
+    # reserve file name of the task
+    d.write('', f'{spec["fname"]}.log')
+
+    spec['dir'] = d.path()
+    spec['submitted'] = _waiting[tid][4]
+    _dump(spec, _path('tasks', tid))
+    _touch(_path('pending', tid))
+
+    try:
+        result = await fut
+
+    except asyncio.CancelledError:
+        _waiting.pop(tid, None)
+
+        try:
+            remove(_path('pending', tid))
+            remove(_path('tasks', tid))
+
+        except FileNotFoundError:
+            # task is being executed, notify the job executing it
+            _touch(_path('cancelled', tid))
+
+        raise
+
+    emit('release', d)
+
+    return result
+
+
+def pending(age: float = 0.0) -> tp.List[Resource]:
+    """Resources of tasks submitted from this process that are not claimed by any job.
+
+    Args:
+        age (float, optional): Only include tasks submitted at least certain seconds ago. Defaults to 0.0.
+
+    Returns:
+        tp.List[Resource]: Resource of each task (see nnodes.mpiexec.getresource).
+    """
+    now = time()
+
+    return [entry[3] for entry in _waiting.values() if not entry[2] and now - entry[4] >= age]
+
+
+async def _poll():
+    """Collect results of submitted tasks and release expired leases."""
+    from .mpiexec import _setdispatch
+    from .trace import emit
+
+    while True:
+        await asyncio.sleep(_poll_interval)
+        now = time()
+
+        leases = _ls('leased')
+
+        for name in set(_renewals).difference(leases):
+            del _renewals[name]
+
+        for name in leases:
+            # lease file is named <task id>@<claim id>
+            tid = name.split('@')[0]
+
+            if (entry := _waiting.get(tid)) and not entry[2]:
+                # task is claimed by a job
+                entry[2] = True
+                _setdispatch(entry[1])
+                emit('dispatch', entry[1])
+
+            try:
+                mtime = path.getmtime(src := _path('leased', name))
+
+                if (seen := _renewals.get(name)) is None or seen[0] != mtime:
+                    _renewals[name] = (mtime, now)
+
+                elif now - seen[1] > root.lease_timeout:
+                    # job executing the task stopped renewing the lease, execute again
+                    rename(src, _path('pending', tid))
+                    del _renewals[name]
+
+            except FileNotFoundError:
+                pass
+
+        for tid in _ls('done'):
+            result = _load(_path('done', tid))
+            remove(_path('done', tid))
+
+            if path.exists(src := _path('tasks', tid)):
+                remove(src)
+
+            if (entry := _waiting.pop(tid, None)) and not entry[0].done():
+                if result.get('error') is not None:
+                    # task could not be executed, handled by the retry policy of the node
+                    entry[0].set_exception(result['error'])
+
+                else:
+                    entry[0].set_result((result['returncode'], result['timeout']))
+
+
+async def work(exit_idle: bool = False, idle: float | None = None, pilot: str | None = None):
+    """Claim and execute tasks in root.lease_dir while resource of current job is available.
+
+    Args:
+        exit_idle (bool, optional): Exit if the workflow is finished or the walltime of current job is used up,
+            and no task is running. Defaults to False.
+        idle (float | None, optional): Also exit if no task is executed for certain minutes
+            (requires exit_idle). Defaults to None.
+        pilot (str | None, optional): Id of the pilot allocation of current job (see nnodes.pilot),
+            liveness is written to root.lease_dir/pilots. Defaults to None.
+    """
+    # cached commands of pending tasks
+    specs: tp.Dict[str, dict] = {}
+
+    # tasks being executed
+    running: tp.Set[asyncio.Task] = set()
+
+    # last time any task is being executed
+    active = time()
+
+    try:
+        while True:
+            if pilot:
+                _touch(_path('pilots', pilot))
+
+            closed = path.exists(_path('closed'))
+
+            if not closed and root.job.until_drain > 0:
+                _claim(specs, running)
+
+            if len(running):
+                active = time()
+
+            elif exit_idle and (closed or root.job.until_drain <= 0 or (idle is not None and time() - active > idle * 60)):
+                break
+
+            await asyncio.sleep(_poll_interval)
+
+    finally:
+        if pilot and path.isdir(_path('pilots')):
+            # notify the workflow job that the allocation is released
+            _touch(_path('pilots', f'{pilot}.exit'))
+
+
+def _claim(specs: tp.Dict[str, dict], running: tp.Set[asyncio.Task]):
+    """Claim and execute pending tasks that fit into available resource."""
+    from .mpiexec import getresource, _dispatch, _release, _sample, _admit
+
+    global _nclaimed
+
+    pending = _ls('pending')
+
+    for tid in list(specs):
+        if tid not in pending:
+            del specs[tid]
+
+    for tid in pending:
+        if tid not in specs:
+            try:
+                specs[tid] = _load(_path('tasks', tid))
+
+            except FileNotFoundError:
+                pass
+
+    # highest priority first, then in order of submission
+    for tid in sorted(specs, key=lambda t: (-specs[t]['priority'], specs[t]['submitted'])):
+        spec = specs[tid]
+        res = getresource(spec['nprocs'], spec['cpus_per_proc'], spec['gpus_per_proc'], spec['mps'],
+            spec['memory_per_proc'], spec['use_multiprocessing'])
+        fut = asyncio.get_running_loop().create_future()
+
+        if not _fits(res) or (spec['timeout'] == 'auto' and not _admit(spec['estimate'])) or not _dispatch(fut, res):
+            # leave the task to a job with more resource or walltime
+            continue
+
+        try:
+            # rename is atomic, so that only one job can claim the task,
+            # the lease is named after the claim so that a stalled job cannot renew a lease claimed again by another job
+            _nclaimed += 1
+            rename(_path('pending', tid), lease := _path('leased', f'{tid}@{_worker}.{_nclaimed}'))
+
+        except FileNotFoundError:
+            _release(fut, False)
+            continue
+
+        _sample()
+        task = asyncio.create_task(_execute(tid, lease, spec, fut))
+        running.add(task)
+        task.add_done_callback(running.discard)
+
+
+def _complete(tid: str, lease: str, result: dict) -> bool:
+    """Write the result of a task if current job still owns its lease."""
+    try:
+        # removing the lease fails if it expired, so that the result is only written by the job owning the lease
+        remove(lease)
+
+    except FileNotFoundError:
+        return False
+
+    _dump({**result, 'worker': _worker}, _path('done', tid))
+
+    return True
+
+
+async def _execute(tid: str, lease: str, spec: dict, fut: asyncio.Future):
+    """Execute a claimed task and write its result to root.lease_dir."""
+    from .mpiexec import getcmd, _release
+
+    d = Directory(spec['dir'])
+    fname = spec['fname']
+
+    # timeout due to insufficient walltime of current job
+    timeout = spec['timeout']
+    walltime_out = False
+
+    if timeout == 'auto':
+        if root.job.inqueue:
+            timeout = root.job.remaining * 60
+            walltime_out = True
+
+        else:
+            timeout = None
+
+    # None if task finished, otherwise 'timeout', 'cancelled' or 'lost'
+    status: str | None = None
+
+    # lease is renewed several times before it expires
+    interval = root.lease_timeout / 5
+
+    # subprocess of the task
+    process = None
+
+    try:
+        cmd = getcmd(spec['cmd'], spec['nprocs'], spec['cpus_per_proc'], spec['gpus_per_proc'], spec['mps'],
+            spec['memory_per_proc'], spec['use_multiprocessing'], spec['exec_args'])
+        d.write(f'{cmd}\n', f'{fname}.log')
+        time_start = time()
+
+        with open(d.path(f'{fname}.stdout'), 'w') as f_o, open(d.path(f'{fname}.stderr'), 'w') as f_e:
+            process = await asyncio.create_subprocess_shell(cmd, cwd=spec['cwd'], stdout=f_o, stderr=f_e,
+                start_new_session=True, env={**environ, **spec['env']} if spec['env'] else None)
+            wait = asyncio.ensure_future(process.wait())
+
+            try:
+                while True:
+                    dt = interval if timeout is None else min(interval, max(timeout - time() + time_start, 0.1))
+                    done, _ = await asyncio.wait([wait], timeout=dt)
+
+                    if len(done):
+                        break
+
+                    if timeout is not None and time() - time_start > timeout:
+                        status = 'timeout'
+                        break
+
+                    if path.exists(_path('cancelled', tid)):
+                        status = 'cancelled'
+                        break
+
+                    try:
+                        utime(lease)
+
+                    except FileNotFoundError:
+                        # lease expired and the task is given to another job
+                        status = 'lost'
+                        break
+
+            finally:
+                terminate(process)
+
+            await wait
+
+        if status == 'timeout' and walltime_out:
+            try:
+                # let another job execute the task
+                rename(lease, _path('pending', tid))
+
+            except FileNotFoundError:
+                # lease expired
+                pass
+
+        elif status in (None, 'timeout'):
+            if status is None:
+                d.write(f'\nelapsed: {timedelta(seconds=int(time()-time_start))}\n', f'{fname}.log', 'a')
+
+            _complete(tid, lease, {'returncode': process.returncode, 'timeout': status == 'timeout'})
+
+        elif status == 'cancelled':
+            for src in (lease, _path('cancelled', tid), _path('tasks', tid)):
+                if path.exists(src):
+                    remove(src)
+
+    except Exception as e:
+        # task cannot be executed (e.g. cwd or executable is missing), report to the workflow instead of
+        # letting the lease expire so that the task is not executed again without limit
+        if process is not None:
+            terminate(process)
+
+        try:
+            pickle.dumps(e)
+
+        except Exception:
+            e = RuntimeError(f'{type(e).__name__}: {e}')
+
+        if path.isdir(_path('done')):
+            _complete(tid, lease, {'error': e})
+
+    finally:
+        _release(fut)
@@ -7,6 +7,7 @@ from traceback import format_exc
 from functools import partial
 
 from .root import root, Node
+from .profiling import profile
 
 if tp.TYPE_CHECKING:
     from mpi4py.MPI import Intracomm
@@ -42,8 +43,7 @@ def _call(size: int, idx: int):
         root.mpi.size = size
     
     # saved function and arguments from main process
-    (func, args, mpiarg, group_mpiarg) = root.load(f'{argv[1]}.pickle')
-    
+    (func, args, mpiarg, group_mpiarg, profiler) = root.load(f'{argv[1]}.pickle')
 
     # call target function
     if callable(func):
@@ -62,12 +62,14 @@ def _call(size: int, idx: int):
         else:
             args_all.append([])
         
-        for a in args_all:
-            if args is not None:
-                a += args
-
-            if asyncio.iscoroutine(result := func(*a)):
-                asyncio.run(result)
+        # profile output is written to <node directory>/<mpiexec file name>.<rank> (e.g. mpiexec_func.0.prof)
+        with profile(profiler, f'{argv[1]}.{root.mpi.rank}'):
+            for a in args_all:
+                if args is not None:
+                    a += args
+
+                if asyncio.iscoroutine(result := func(*a)):
+                    asyncio.run(result)
     
     else:
         from subprocess import check_call
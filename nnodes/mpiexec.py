@@ -1,39 +1,512 @@
 from __future__ import annotations
 import asyncio
 import typing as tp
+from os import path, environ
 from math import ceil
 from time import time
 from datetime import timedelta
+from heapq import heappush, heappop
 from fractions import Fraction
 
 from .root import root
-from .node import getname, getnargs, parse_import, Task, InsufficientWalltime
-from .directory import Directory
+from .node import Node, getname, getnargs, parse_import, Task, InsufficientWalltime
+from .directory import Directory, terminate
+from .trace import emit
 
 if tp.TYPE_CHECKING:
+    from asyncio.subprocess import Process
     from .job import Job
 
 
-# pending task, asyncio.Lock -> (nnodes, priority) (Fraction for MPI tasks, int for multiprocessing tasks)
-_pending: tp.Dict[asyncio.Lock, tp.Tuple[Fraction | int, int]] = {}
+# resource occupied by a task, (CPUs, GPUs, memory) in number of nodes for MPI tasks, number of processes for multiprocessing tasks
+Resource = tp.Tuple[Fraction, Fraction, Fraction] | int
 
-# running tasks, asyncio.Lock -> nnodes
-_running: tp.Dict[asyncio.Lock, Fraction | int] = {}
 
+# pending tasks of each resource class (True for multiprocessing tasks), asyncio.Future -> (resource, priority)
+_pending: tp.Dict[bool, tp.Dict[asyncio.Future, tp.Tuple[Resource, int]]] = {False: {}, True: {}}
 
-def _dispatch(lock: asyncio.Lock, nnodes: Fraction | int) -> bool:
+# pending tasks of each resource class as heaps of (-priority, -nnodes, order of submission, asyncio.Future),
+# entries of futures that are no longer in _pending are skipped when popped
+_queue: tp.Dict[bool, tp.List[tp.Tuple[int, Fraction | int, int, asyncio.Future]]] = {False: [], True: []}
+
+# number of tasks added to _queue
+_nqueued = 0
+
+# running tasks of each resource class, asyncio.Future -> resource
+_running: tp.Dict[bool, tp.Dict[asyncio.Future, Resource]] = {False: {}, True: {}}
+
+# resource held by running tasks of each resource class, [CPUs, GPUs, memory] in number of nodes or [processes]
+_used: tp.Dict[bool, tp.List[tp.Any]] = {False: [Fraction(0)] * 3, True: [0]}
+
+# current resource usage, [nodes running, nodes pending, processes running, processes pending]
+_totals: tp.List[tp.Any] = [Fraction(0), Fraction(0), 0, 0]
+
+# resource usage after each change, (time, nodes running, nodes pending, processes running, processes pending)
+_samples: tp.List[tp.Tuple[float, float, float, int, int]] = []
+
+# time between starting and dispatching each MPI task (in seconds)
+_waits: tp.List[float] = []
+
+# interval (in seconds) of checking whether a speculative task is straggling
+_speculative_interval = 10
+
+# minimum number of finished sibling tasks required to launch a speculative duplicate
+_speculative_min = 3
+
+# runtimes (in seconds) of finished MPI tasks, task key (see _taskkey) -> sorted runtimes, loaded from checkpoint on first use
+_runtimes: tp.Dict[str, tp.List[float]] | None = None
+
+# minimum number of finished tasks with the same key required to refuse starting a task
+_admission_min = 3
+
+
+def getnnodes(res: Resource) -> Fraction | int:
+    """Number of nodes (or processes for multiprocessing tasks) occupied by a task."""
+    if isinstance(res, int):
+        return res
+
+    return max(res)
+
+
+def _resdict(res: Resource) -> dict:
+    """Resource of a task as event data."""
+    if isinstance(res, int):
+        return {'procs': res}
+
+    return {'nodes': float(max(res)), 'res': [float(r) for r in res]}
+
+
+def _dispatch(fut: asyncio.Future, res: Resource) -> bool:
     """Execute a task if resource is available."""
-    ntotal = root.job.mp_nprocs_max if (
-        mp := isinstance(nnodes, int)) else root.job.nnodes
-    nrunning = sum(v for v in _running.values() if isinstance(v, int) == mp)
+    mp = isinstance(res, int)
+    running = _running[mp]
+    used = _used[mp]
+
+    if mp:
+        # multiprocessing task, only the number of processes is limited
+        if len(running) == 0 or res <= root.job.mp_nprocs_max - used[0]:
+            running[fut] = res
+            used[0] += res
+            _totals[2] += res
+            return True
+
+        return False
 
-    if nrunning == 0 or nnodes <= ntotal - nrunning:
-        _running[lock] = nnodes
+    # MPI task, CPUs, GPUs and memory are checked separately
+    if len(running) == 0 or all(res[i] <= root.job.nnodes - used[i] for i in range(3)): # type: ignore
+        running[fut] = res
+
+        for i in range(3):
+            used[i] += res[i] # type: ignore
+
+        _totals[0] += max(res) # type: ignore
         return True
 
     return False
 
 
+async def _acquire(res: Resource, priority: int) -> asyncio.Future:
+    """Wait until resource is available, returns the future that holds the resource."""
+    fut = asyncio.get_running_loop().create_future()
+
+    if _dispatch(fut, res):
+        _sample()
+        return fut
+
+    global _nqueued
+
+    mp = isinstance(res, int)
+    pending = _pending[mp]
+    pending[fut] = (res, priority)
+    _totals[3 if mp else 1] += getnnodes(res)
+    _nqueued += 1
+    heappush(_queue[mp], (-priority, -getnnodes(res), _nqueued, fut))
+    _sample()
+
+    try:
+        await fut
+
+    except asyncio.CancelledError:
+        # remove cancelled task from queue (and free resource if it was dispatched at the same time)
+        _dequeue(fut, mp)
+        _release(fut)
+        raise
+
+    return fut
+
+
+def _flush():
+    """Wake up all pending tasks without resource so that they exit while the job is draining."""
+    for pending in _pending.values():
+        for fut in pending:
+            if not fut.done():
+                fut.set_result(None)
+
+        pending.clear()
+
+    for queue in _queue.values():
+        queue.clear()
+
+    _totals[1] = Fraction(0)
+    _totals[3] = 0
+    _sample()
+
+
+def _dequeue(fut: asyncio.Future, mp: bool) -> tp.Tuple[Resource, int] | None:
+    """Remove a task from pending tasks, returns its resource and priority."""
+    if (np := _pending[mp].pop(fut, None)) is not None:
+        _totals[3 if mp else 1] -= getnnodes(np[0])
+
+    return np
+
+
+def _release(fut: asyncio.Future, wakeup: bool = True):
+    """Free the resource held by a task."""
+    for mp, running in _running.items():
+        if fut in running:
+            res = running.pop(fut)
+            used = _used[mp]
+
+            if mp:
+                used[0] -= res
+                _totals[2] -= res
+
+            else:
+                for i in range(3):
+                    used[i] -= res[i] # type: ignore
+
+                _totals[0] -= max(res) # type: ignore
+
+            if wakeup:
+                _wakeup(mp)
+
+            _sample()
+            break
+
+
+def _wakeup(mp: bool):
+    """Dispatch pending tasks of a resource class that fit into the free resource."""
+    pending = _pending[mp]
+    queue = _queue[mp]
+    used = _used[mp]
+    limit = root.job.mp_nprocs_max if mp else root.job.nnodes
+
+    # tasks that do not fit into the free resource
+    skipped = []
+
+    # tasks with higher priority (then larger tasks) are tried first, any task that fits is executed
+    # (same as a new task in _acquire), the queue is not searched further once all CPUs are used
+    while len(queue) and used[0] < limit:
+        entry = heappop(queue)
+        fut = entry[3]
+
+        if fut.done() or fut not in pending:
+            # task is cancelled
+            _dequeue(fut, mp)
+
+        elif _dispatch(fut, pending[fut][0]):
+            _dequeue(fut, mp)
+            fut.set_result(None)
+
+        else:
+            skipped.append(entry)
+
+    for entry in skipped:
+        heappush(queue, entry)
+
+
+def _sample():
+    """Record current resource usage."""
+    _samples.append((time(), float(_totals[0]), float(_totals[1]), _totals[2], _totals[3]))
+
+
+def metrics() -> dict:
+    """Resource utilization of MPI tasks since the job started.
+
+    Returns:
+        dict: Node hours used and allocated (nnodes * elapsed walltime), time-averaged and maximum number of
+            running and pending nodes, process hours of multiprocessing tasks and queue wait time of MPI tasks.
+    """
+    now = time()
+    start = root.job._exec_start
+    hours = (now - start) / 3600
+
+    # integrate number of running and pending nodes over time
+    used = [0.0] * 4
+    peak = [0.0] * 4
+
+    for i, sample in enumerate(_samples):
+        dt = (_samples[i + 1][0] if i + 1 < len(_samples) else now) - sample[0]
+
+        for j in range(4):
+            used[j] += sample[j + 1] * dt / 3600
+            peak[j] = max(peak[j], sample[j + 1])
+
+    result: tp.Dict[str, tp.Any] = {
+        'start': start,
+        'end': now,
+        'nnodes': root.job.nnodes,
+        'node_hours_allocated': root.job.nnodes * hours,
+        'node_hours_used': used[0],
+        'utilization': used[0] / (root.job.nnodes * hours) if hours > 0 else 0.0,
+        'nodes_running_mean': used[0] / hours if hours > 0 else 0.0,
+        'nodes_running_max': peak[0],
+        'nodes_pending_mean': used[1] / hours if hours > 0 else 0.0,
+        'nodes_pending_max': peak[1],
+        'proc_hours_used': used[2],
+        'procs_pending_max': peak[3],
+        'ntasks': len(_waits)
+    }
+
+    if len(_waits):
+        waits = sorted(_waits)
+        result['queue_wait_mean'] = sum(waits) / len(waits)
+        result['queue_wait_median'] = waits[len(waits) // 2]
+        result['queue_wait_max'] = waits[-1]
+
+    return result
+
+
+def summarize():
+    """Print resource utilization and append it to root.metrics_file."""
+    if len(_samples) == 0:
+        # no MPI task executed
+        return
+
+    m = metrics()
+
+    def fmt(seconds: float) -> str:
+        return str(timedelta(seconds=int(seconds)))
+
+    if m['node_hours_used'] > 0:
+        print(f'node hours: {m["node_hours_used"]:.2f} used / {m["node_hours_allocated"]:.2f} allocated '
+            f'({m["utilization"]*100:.1f}%), max running {m["nodes_running_max"]:.2f} nodes, '
+            f'max pending {m["nodes_pending_max"]:.2f} nodes')
+
+    if m['proc_hours_used'] > 0:
+        print(f'process hours: {m["proc_hours_used"]:.2f} used, max pending {m["procs_pending_max"]} processes')
+
+    if m['ntasks'] > 0:
+        print(f'queue wait: mean {fmt(m["queue_wait_mean"])}, median {fmt(m["queue_wait_median"])}, '
+            f'max {fmt(m["queue_wait_max"])} ({m["ntasks"]} tasks)')
+
+    if root.metrics_file:
+        history = root.load(root.metrics_file) if root.has(root.metrics_file) else []
+        history.append(m)
+        root.dump(history, root.metrics_file)
+
+
+def _quantile(d: Directory, q: float) -> float | None:
+    """Runtime quantile of the finished sibling MPI tasks."""
+    if not isinstance(d, Node) or d._parent is None:
+        return None
+
+    runtimes = sorted(tp.cast(float, node._endtime) - tp.cast(float, node._dispatchtime) for node in d.parent
+        if node is not d and node._is_mpi and node._dispatchtime and node._endtime and not node._cancelled)
+
+    if len(runtimes) < _speculative_min:
+        return None
+
+    return runtimes[min(int(q * len(runtimes)), len(runtimes) - 1)]
+
+
+def _taskkey(d: Directory) -> str | None:
+    """Key of tasks that share runtime history, node name with numbers removed (e.g. forward_3 -> forward_#)."""
+    if not isinstance(d, Node):
+        return None
+
+    return _namekey(d.name)
+
+
+def _namekey(name: str) -> str:
+    """Task key of a node name."""
+    import re
+
+    return re.sub(r'\d+', '#', name)
+
+
+def _parseelapsed(d: Node) -> float | None:
+    """Runtime of an MPI task from the elapsed line of its last log file."""
+    try:
+        logs = sorted(entry for entry in d.ls() if entry.startswith('mpiexec') and entry.endswith('.log'))
+
+        if len(logs) and (lines := d.read(logs[-1]).split('elapsed: ')[1:]):
+            h, m, s = lines[-1].strip().split(':')
+            return int(h) * 3600 + int(m) * 60 + float(s)
+
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def _loadsaved(runtimes: tp.Dict[str, tp.List[float]], state: dict, i: int):
+    """Add runtimes of the child nodes of a node that are not restored (see nnodes.checkpoint) from saved arrays."""
+    from .checkpoint import IS_MPI, CANCELLED
+
+    strings = state['strings']
+    flags = state['flags']
+    dispatchtime = state['dispatchtime']
+    endtime = state['endtime']
+
+    for j in range(i + 1, i + state['size'][i]):
+        # NaN is not equal to itself
+        if flags[j] & IS_MPI and not flags[j] & CANCELLED and endtime[j] == endtime[j] and dispatchtime[j] == dispatchtime[j]:
+            runtimes.setdefault(_namekey(strings[state['name'][j]]), []).append(endtime[j] - dispatchtime[j])
+
+
+def _loadruntimes() -> tp.Dict[str, tp.List[float]]:
+    """Runtimes of MPI tasks finished in current and previous runs of the workflow (archived nodes are not included)."""
+    global _runtimes
+
+    if _runtimes is None:
+        _runtimes = {}
+        stack: tp.List[Node] = [root]
+
+        while len(stack):
+            node = stack.pop()
+
+            if node._lazy is not None:
+                # read child nodes from checkpoint arrays instead of restoring them
+                _loadsaved(_runtimes, *node._lazy)
+
+            else:
+                stack.extend(node._children)
+
+            if node._is_mpi and node._endtime and not node._cancelled and (key := _taskkey(node)):
+                if node._dispatchtime:
+                    runtime = node._endtime - node._dispatchtime
+
+                elif (runtime := _parseelapsed(node)) is None:
+                    # checkpoint from a version without dispatch time and no log file
+                    continue
+
+                _runtimes.setdefault(key, []).append(runtime)
+
+        for runtimes in _runtimes.values():
+            runtimes.sort()
+
+    return _runtimes
+
+
+def _record(d: Directory, runtime: float):
+    """Add the runtime of a finished task to runtime history."""
+    from bisect import insort
+
+    if root.job.admission_quantile is not None and (key := _taskkey(d)):
+        insort(_loadruntimes().setdefault(key, []), runtime)
+
+
+def _estimate(d: Directory) -> float | None:
+    """Runtime of a task estimated from the runtime history of tasks with the same key."""
+    if root.job.admission_quantile is None or (key := _taskkey(d)) is None:
+        return None
+
+    runtimes = _loadruntimes().get(key, [])
+
+    if len(runtimes) < _admission_min:
+        return None
+
+    return runtimes[min(int(root.job.admission_quantile * len(runtimes)), len(runtimes) - 1)]
+
+
+def _admit(estimate: float | None) -> bool:
+    """Whether a task with estimated runtime is likely to finish within the remaining walltime of current job."""
+    job = root.job
+
+    if estimate is None or not job.inqueue:
+        return True
+
+    # walltime available to a new job (in seconds), tasks that cannot finish in any job are always started
+    capacity = (job.remaining + (time() - job._exec_start) / 60) * 60
+
+    return estimate <= job.remaining * 60 or estimate > capacity
+
+
+async def _speculate(process: Process, task: str, d: Directory, fname: str,
+    res: Resource, quantile: float, time_start: float) -> int:
+    """Wait for a task, launch a duplicate in a scratch directory if the task is straggling."""
+    wait = asyncio.ensure_future(process.wait())
+
+    # wait until task runtime exceeds the quantile of its siblings and resource is available
+    while True:
+        await asyncio.wait([wait], timeout=_speculative_interval)
+
+        if wait.done():
+            return tp.cast(int, process.returncode)
+
+        if (t := _quantile(d, quantile)) is None or time() - time_start < t:
+            continue
+
+        if len(_pending[isinstance(res, int)]) == 0:
+            # do not take resource from pending tasks
+            fut = asyncio.get_running_loop().create_future()
+
+            if _dispatch(fut, res):
+                _sample()
+                emit('speculate', d, **_resdict(res))
+                break
+
+    # scratch directory with links to the input files and directories of the task, i.e. entries not modified since
+    # the task started (a directory the original task writes into is modified and not linked)
+    dirname = f'{fname}.speculative'
+    scratch = d.subdir(dirname)
+    scratch.rm()
+    scratch.mkdir()
+
+    for entry in d.ls():
+        src = d.path(entry)
+
+        if not entry.startswith(f'{fname}.') and not path.islink(src) and path.getmtime(src) < time_start:
+            scratch.ln(path.join('..', entry), entry)
+
+    # whether the duplicate finishes first
+    dup_wins = False
+
+    try:
+        with open(scratch.path(f'{fname}.stdout'), 'w') as f_o, open(scratch.path(f'{fname}.stderr'), 'w') as f_e:
+            dup = await asyncio.create_subprocess_shell(task, cwd=scratch.path(), stdout=f_o, stderr=f_e, start_new_session=True)
+            wait_dup = asyncio.ensure_future(dup.wait())
+
+            try:
+                done, _ = await asyncio.wait([wait, wait_dup], return_when=asyncio.FIRST_COMPLETED)
+                first, second = (dup, process) if wait_dup in done else (process, dup)
+
+                if first.returncode and second.returncode is None:
+                    # the first one failed, wait for the other one
+                    await second.wait()
+
+                dup_wins = dup.returncode == 0 and (first is dup or process.returncode != 0)
+
+            except asyncio.CancelledError:
+                # task cancelled by node.cancel()
+                terminate(process)
+                raise
+
+            finally:
+                # cancel the slower one and wait until it exits before its files are moved or removed
+                terminate(process if dup_wins else dup)
+                await asyncio.shield(asyncio.gather(wait, wait_dup))
+
+    finally:
+        _release(fut)
+
+    if dup_wins:
+        # move output files from scratch directory
+        for entry in scratch.ls():
+            if not path.islink(scratch.path(entry)):
+                d.rm(entry)
+                d.mv(path.join(dirname, entry), entry)
+
+        scratch.rm()
+
+        return tp.cast(int, dup.returncode)
+
+    scratch.rm()
+
+    return tp.cast(int, process.returncode)
+
+
 def splitargs(mpiarg: list | tuple, nprocs: int) -> list:
     """Split arguments to n processes."""
     # assign a chunk of arg_mpi to each processor
@@ -49,18 +522,119 @@ def splitargs(mpiarg: list | tuple, nprocs: int) -> list:
     return args
 
 
+def getresource(nprocs: int, cpus_per_proc: int, gpus_per_proc: int, mps: int | None,
+    memory_per_proc: float | None, use_multiprocessing: bool | None) -> Resource:
+    """Resource occupied by a task in current job."""
+    if use_multiprocessing:
+        return nprocs
+
+    ncpus = Fraction(nprocs * cpus_per_proc, root.job.cpus_per_node)
+    ngpus = Fraction(0)
+    nmem = Fraction(0)
+
+    if mps:
+        # 1 GPU is shared by <mps> processes
+        if nprocs % mps != 0:
+            raise ValueError(
+                f'nprocs must be a multiple of mpi ({nprocs}, {mps})')
+
+        ngpus = Fraction(nprocs//mps, root.job.gpus_per_node)
+
+    elif gpus_per_proc > 0:
+        ngpus = Fraction(nprocs * gpus_per_proc, root.job.gpus_per_node)
+
+    if memory_per_proc and root.job.memory_per_node:
+        nmem = Fraction(nprocs * memory_per_proc) / Fraction(root.job.memory_per_node)
+
+    if root.job.node_splittable:
+        return (ncpus, ngpus, nmem)
+
+    # task occupies whole nodes
+    nnodes = Fraction(int(ceil(max(ncpus, ngpus, nmem))))
+
+    return (nnodes, nnodes, nnodes)
+
+
+def getcmd(task: str, nprocs: int, cpus_per_proc: int, gpus_per_proc: int, mps: int | None,
+    memory_per_proc: float | None, use_multiprocessing: bool | None, exec_args: tp.Dict[tp.Type[Job], str] | None) -> str:
+    """Wrap a command with the parallel execution command of current job."""
+    if use_multiprocessing:
+        return f'{task} -mp {nprocs}'
+
+    # additional mpiexec arguments
+    args_cmd: str | None = None
+    
+    if exec_args is not None:
+        # use arguments from add_mpi arguments
+        for cls_, args_ in exec_args.items():
+            if isinstance(root.job, cls_):
+                args_cmd = args_
+                break
+    
+    if args_cmd is None:
+        # use default exec_args from root.job
+        args_cmd = root.job.exec_args
+
+    if memory_per_proc:
+        # only pass memory limit if specified to keep compatibility with custom job systems
+        return root.job.mpiexec(
+            task, nprocs, cpus_per_proc, gpus_per_proc, mps, args_cmd, memory_per_proc=memory_per_proc)
+
+    return root.job.mpiexec(task, nprocs, cpus_per_proc, gpus_per_proc, mps, args_cmd)
+
+
+def _setdispatch(d: Directory):
+    """Set dispatch time of a node and record its queue wait time."""
+    if hasattr(d, '_dispatchtime'):
+        setattr(d, '_dispatchtime', time())
+
+        if starttime := getattr(d, '_starttime'):
+            _waits.append(time() - starttime)
+
+
+def _checkoutput(d: Directory, fname: str, check_output: tp.Callable[..., None] | None):
+    """Call custom function to resolve output."""
+    if check_output:
+        nargs = getnargs(check_output)
+
+        if nargs == 0:
+            check_output()
+
+        elif nargs == 1:
+            check_output(d.read(f'{fname}.stdout'))
+
+        else:
+            check_output(d.read(f'{fname}.stdout'),
+                         d.read(f'{fname}.stderr'))
+
+
+def _checkresult(task: str, returncode: int | None, d: Directory, fname: str) -> str:
+    """Raise an error if a finished task failed."""
+    if d.has(f'{fname}.error'):
+        raise RuntimeError(d.read(f'{fname}.error'))
+
+    elif returncode:
+        # include the end of stderr so that the failure can be classified
+        stderr = d.read(f'{fname}.stderr').strip().split('\n')[-10:]
+        raise RuntimeError(f'{task}\nexit code: {returncode}\n' + '\n'.join(stderr))
+
+    return fname
+
+
 async def mpiexec(cmd: Task,
                   nprocs: int | tp.Callable[[Directory], int], cpus_per_proc: int, gpus_per_proc: int,
                   mps: int | None, fname: str | None, args: list | tuple | None, mpiarg: list | tuple | None,
                   group_mpiarg: bool, check_output: tp.Callable[..., None] | None, use_multiprocessing: bool | None,
                   timeout: tp.Literal['auto'] | float | None, ontimeout: tp.Literal['raise'] | tp.Callable[[], None] | None,
-                  priority: int, exec_args: tp.Dict[tp.Type[Job], str] | None, d: Directory) -> str:
+                  priority: int, exec_args: tp.Dict[tp.Type[Job], str] | None, d: Directory, *,
+                  memory_per_proc: float | None = None, speculative: float | None = None,
+                  checkpoint: dict | None = None) -> str:
     """Schedule the execution of MPI task."""
-    # task queue controller
-    lock = asyncio.Lock()
+    # future that holds the resource of the task
+    fut: asyncio.Future | None = None
 
-    # error occurred
-    err = None
+    # whether to dispatch pending tasks after the task is done
+    wakeup = True
 
     try:
         # get number of MPI processes
@@ -71,38 +645,36 @@ async def mpiexec(cmd: Task,
         if mpiarg:
             nprocs = min(len(mpiarg), nprocs)
 
-        # calculate node number
-        if use_multiprocessing:
-            nnodes = nprocs
+        # calculate resource occupied by the task
+        res = getresource(nprocs, cpus_per_proc, gpus_per_proc, mps, memory_per_proc, use_multiprocessing)
+        emit('queue', d, **_resdict(res))
 
-        else:
-            nnodes = Fraction(nprocs * cpus_per_proc, root.job.cpus_per_node)
+        if not root.lease_dir:
+            # wait for node resources
+            if not root.job._draining:
+                fut = await _acquire(res, priority)
 
-            if mps:
-                # 1 GPU is shared by <mps> processes
-                if nprocs % mps != 0:
-                    raise ValueError(
-                        f'nprocs must be a multiple of mpi ({nprocs}, {mps})')
+            if root.job._draining:
+                raise InsufficientWalltime('Job is draining.')
 
-                nnodes = max(nnodes, Fraction(nprocs//mps, root.job.gpus_per_node))
+            if timeout == 'auto' and not _admit(_estimate(d)):
+                # leave the task to the next job instead of starting a task that is likely to be killed,
+                # shorter tasks can still use the freed resource
+                _release(tp.cast(asyncio.Future, fut))
+                fut = None
+                root.job._deferred = True
 
-            elif gpus_per_proc > 0:
-                nnodes = max(nnodes, Fraction(
-                    nprocs * gpus_per_proc, root.job.gpus_per_node))
+                # let tasks started at the same time reach the queue before checking
+                await asyncio.sleep(0)
 
-            if not root.job.node_splittable:
-                nnodes = Fraction(int(ceil(nnodes)))
+                if not any(len(r) for r in _running.values()) and not any(len(p) for p in _pending.values()):
+                    # no other task can be admitted, requeue now
+                    root._drain()
 
-        # wait for node resources
-        await lock.acquire()
+                raise InsufficientWalltime('Task is unlikely to finish within remaining walltime.')
 
-        if not _dispatch(lock, nnodes):
-            _pending[lock] = (nnodes, priority)
-            await lock.acquire()
-
-        # set dispatchtime for node
-        if hasattr(d, '_dispatchtime'):
-            setattr(d, '_dispatchtime', time())
+            emit('dispatch', d, **_resdict(res))
+            _setdispatch(d)
 
         # determine file name for log, stdout and stderr
         if fname is None:
@@ -143,33 +715,57 @@ async def mpiexec(cmd: Task,
 
             cwd = None
             d.rm(f'{fname}.*')
-            d.dump((task, args, mpiarg, group_mpiarg), f'{fname}.pickle')
+            d.dump((task, args, mpiarg, group_mpiarg, getattr(d, 'profiler')), f'{fname}.pickle')
             task = f'python -m "nnodes.mpi" {d.path(fname)}'
 
         else:
             cwd = d.path()
 
-        # wrap with parallel execution command
-        if use_multiprocessing:
-            task = f'{task} -mp {nprocs}'
+        # environment variables added to the task
+        env: tp.Dict[str, str] = {}
 
-        else:
-            # additional mpiexec arguments
-            args_cmd: str | None = None
-            
-            if exec_args is not None:
-                # use arguments from add_mpi arguments
-                for cls_, args_ in exec_args.items():
-                    if isinstance(root.job, cls_):
-                        args_cmd = args_
-                        break
-            
-            if args_cmd is None:
-                # use default exec_args from root.job
-                args_cmd = root.job.exec_args
-
-            task = root.job.mpiexec(
-                task, nprocs, cpus_per_proc, gpus_per_proc, mps, args_cmd)
+        if checkpoint:
+            from .restart import Checkpoint
+
+            cp = Checkpoint(checkpoint)
+
+            if restart := cp.getrestart(d):
+                # continue from the restart file written in a previous run
+                env[cp.env] = restart
+
+                if cp.arg and cwd is not None:
+                    task = f'{task} {cp.arg.format(restart)}'
+
+        if root.lease_dir:
+            # execute by any job that shares root.lease_dir (see nnodes.lease)
+            from .lease import submit
+
+            returncode, timedout = await submit(d, {
+                'cmd': task, 'cwd': cwd, 'fname': fname, 'nprocs': nprocs, 'cpus_per_proc': cpus_per_proc,
+                'gpus_per_proc': gpus_per_proc, 'mps': mps, 'memory_per_proc': memory_per_proc,
+                'use_multiprocessing': use_multiprocessing, 'exec_args': exec_args, 'priority': priority,
+                'timeout': timeout, 'estimate': _estimate(d), 'env': env})
+
+            if timedout:
+                if ontimeout == 'raise':
+                    raise asyncio.TimeoutError(f'{task} timed out')
+
+                elif ontimeout:
+                    ontimeout()
+
+            _checkoutput(d, fname, check_output)
+            _checkresult(task, returncode, d, fname)
+
+            if checkpoint:
+                cp.clear(d)
+
+            if dispatchtime := getattr(d, '_dispatchtime', None):
+                _record(d, time() - dispatchtime)
+
+            return fname
+
+        # wrap with parallel execution command
+        task = getcmd(task, nprocs, cpus_per_proc, gpus_per_proc, mps, memory_per_proc, use_multiprocessing, exec_args)
 
         # write the command actually used
         d.write(f'{task}\n', f'{fname}.log')
@@ -178,84 +774,86 @@ async def mpiexec(cmd: Task,
         # timeout due to insufficient walltime
         walltime_out = False
 
+        if timeout == 'auto':
+            if root.job.inqueue:
+                timeout = root.job.remaining * 60
+                walltime_out = True
+
+            else:
+                timeout = None
+
         # create subprocess to execute task
         with open(d.path(f'{fname}.stdout'), 'w') as f_o, open(d.path(f'{fname}.stderr'), 'w') as f_e:
 
-            # execute in subprocess
-            process = await asyncio.create_subprocess_shell(task, cwd=cwd, stdout=f_o, stderr=f_e)
+            # execute in subprocess (in a new process group so that it can be terminated with its child processes)
+            process = await asyncio.create_subprocess_shell(task, cwd=cwd, stdout=f_o, stderr=f_e, start_new_session=True,
+                env={**environ, **env} if env else None)
 
-            if timeout == 'auto':
-                if root.job.inqueue:
-                    timeout = root.job.remaining * 60
-                    walltime_out = True
+            # exit code of the task
+            returncode: int | None = None
 
-                else:
-                    timeout = None
+            # wait for the task (or its speculative duplicate) to finish
+            if speculative and cwd is not None:
+                wait = _speculate(process, task, d, fname, res, speculative, time_start)
 
-            if timeout:
-                try:
-                    await asyncio.wait_for(process.communicate(), timeout)
+            else:
+                wait = process.wait()
 
-                except asyncio.TimeoutError as e:
-                    if walltime_out:
-                        raise InsufficientWalltime('Insufficient walltime.')
+            try:
+                if timeout:
+                    try:
+                        if checkpoint and walltime_out:
+                            # signal the task to write a restart file before walltime runs out
+                            returncode = await cp.wait(wait, process, d, timeout)
 
-                    elif ontimeout == 'raise':
-                        raise e
+                        else:
+                            returncode = await asyncio.wait_for(wait, timeout)
 
-                    elif ontimeout:
-                        ontimeout()
+                    except asyncio.TimeoutError as e:
+                        if walltime_out:
+                            if checkpoint:
+                                # let other running tasks finish before requeue
+                                root._drain()
 
-            else:
-                await process.communicate()
+                            raise InsufficientWalltime('Insufficient walltime.')
 
-        # custom function to resolve output
-        if check_output:
-            nargs = getnargs(check_output)
+                        elif ontimeout == 'raise':
+                            raise e
 
-            if nargs == 0:
-                check_output()
+                        elif ontimeout:
+                            ontimeout()
 
-            elif nargs == 1:
-                check_output(d.read(f'{fname}.stdout'))
+                else:
+                    returncode = await wait
 
-            else:
-                check_output(d.read(f'{fname}.stdout'),
-                             d.read(f'{fname}.stderr'))
+            except asyncio.CancelledError:
+                # task cancelled by node.cancel()
+                terminate(process)
+                raise
+
+        # custom function to resolve output
+        _checkoutput(d, fname, check_output)
 
         # write elapsed time
         d.write(
             f'\nelapsed: {timedelta(seconds=int(time()-time_start))}\n', f'{fname}.log', 'a')
 
-        if d.has(f'{fname}.error'):
-            raise RuntimeError(d.read(f'{fname}.error'))
-
-        elif process.returncode:
-            raise RuntimeError(f'{task}\nexit code: {process.returncode}')
-
-    except Exception as e:
-        err = e
-
-    # clear entry
-    if lock in _pending:
-        del _pending[lock]
-
-    if lock in _running:
-        del _running[lock]
+        _checkresult(task, returncode, d, fname)
+        _record(d, time() - time_start)
 
-    # run next MPI task
-    if not isinstance(err, InsufficientWalltime) and len(_pending) > 0:
-        # sort entries by their node number and priority, np is (nnodes, priority)
-        nnodes_max = max(np[0] for np in _pending.values())
-        pendings = sorted(_pending.items(), key=lambda item: item[1][1] * nnodes_max + item[1][0], reverse=True)
+        if checkpoint:
+            # restart file is only used to continue an interrupted task
+            cp.clear(d)
 
-        # execute tasks if resource is available
-        for lock, np in pendings:
-            if _dispatch(lock, np[0]):
-                del _pending[lock]
-                lock.release()
+    except InsufficientWalltime:
+        # do not run next MPI task
+        wakeup = False
+        raise
 
-    if err:
-        raise err
+    finally:
+        # free resource (also when the task is cancelled)
+        if fut is not None:
+            _release(fut, wakeup)
+            emit('release', d)
 
     return tp.cast(str, fname)
@@ -52,9 +52,34 @@ def getname(task: Task) -> str | None:
         return task.__name__.lstrip('_')
 
 
+def gethints() -> tp.Dict[str, tp.Any]:
+    """Type hints of Node (cached because tp.get_type_hints() is slow)."""
+    global _hints
+
+    if _hints is None:
+        _hints = tp.get_type_hints(Node)
+
+    return _hints
+
+
+def touch():
+    """Mark the tree as changed since last checkpoint."""
+    global _generation
+    _generation += 1
+
+
 # type for a node task
 Task = tp.Callable | tp.List[str] | tp.Tuple[str, ...] | str
 
+# cached type hints of Node
+_hints: tp.Dict[str, tp.Any] | None = None
+
+# number of changes to the tree, root.checkpoint() is skipped if unchanged since last save
+_generation = 0
+
+# runtime attributes that are not saved to checkpoint
+_transient = ('_executing_async', '_executing', '_blob', '_flags', '_lazy')
+
 
 class Node(Directory):
     """A directory with a task."""
@@ -100,12 +125,33 @@ class Node(Directory):
     # exception raised from self.task
     _err: Exception | None = None
 
+    # task is cancelled by node.cancel()
+    _cancelled: bool = False
+
     # child nodes
     _children: tp.List[Node]
 
     # currently executing async child tasks
     _executing_async: tp.List[tp.Tuple[asyncio.Task, Node]] | None = None
 
+    # currently executing async self.task
+    _executing: asyncio.Task | None = None
+
+    # pickled node data not yet loaded from checkpoint (see nnodes.checkpoint)
+    _blob: bytes | None = None
+
+    # node state flags loaded from checkpoint
+    _flags: int = 0
+
+    # checkpoint and node index to restore child nodes from when accessed (only for finished nodes)
+    _lazy: tp.Tuple[dict, int] | None = None
+
+    # summary of child nodes moved to an archive file by node.archive()
+    _archived: dict | None = None
+
+    # latest value returned by self.prober while the task is running (evaluated by root every root.probe_interval)
+    _probed: float | str | None = None
+
     @property
     def name(self) -> str:
         """Node name."""
@@ -127,17 +173,63 @@ class Node(Directory):
     @property
     def done(self) -> bool:
         """Main function and child nodes executed successfully."""
-        if self._endtime:
-            return all(node.done for node in self)
-
-        return False
+        return self._isdone(None)
 
     @property
     def elapsed(self) -> float | None:
         """Total walltime."""
-        if self.done:
+        return self._getelapsed(None)
+
+    def _isdone(self, cache: dict | None) -> bool:
+        """Get self.done, results of child nodes are stored in cache if not None."""
+        if self._cancelled or self._lazy is not None or self._archived is not None:
+            return True
+
+        if self._endtime:
+            if cache is None:
+                return all(node.done for node in self)
+
+            key = (id(self), 'done')
+
+            if key not in cache:
+                cache[key] = all(node._isdone(cache) for node in self)
+
+            return cache[key]
+
+        return False
+
+    def _getelapsed(self, cache: dict | None) -> float | None:
+        """Get self.elapsed, results of child nodes are stored in cache if not None."""
+        if cache is not None:
+            key = (id(self), 'elapsed')
+
+            if key not in cache:
+                cache[key] = self._getelapsed_uncached(cache)
+
+            return cache[key]
+
+        return self._getelapsed_uncached(None)
+
+    def _getelapsed_uncached(self, cache: dict | None) -> float | None:
+        """Compute self.elapsed from elapsed time of child nodes."""
+        if self._cancelled:
+            # time spent before the node is cancelled
+            if self._starttime and self._endtime:
+                return self._endtime - (self._dispatchtime or self._starttime)
+
+            return 0.0
+
+        if self._archived is not None:
+            return self._archived['elapsed']
+
+        if self._lazy is not None:
+            # child nodes are not restored from checkpoint
+            from .checkpoint import getelapsed
+            return getelapsed(self)
+
+        if self._isdone(cache):
             delta = self._endtime - (self._dispatchtime or self._starttime) # type: ignore
-            delta_ws = tp.cast(tp.List[float], [node.elapsed for node in self])
+            delta_ws = tp.cast(tp.List[float], [node._getelapsed(cache) for node in self])
 
             if self.concurrent and len(delta_ws) > 1:
                 return delta + max(*delta_ws)
@@ -154,33 +246,54 @@ class Node(Directory):
     def __getattr__(self, key: str):
         """Get node data (including parent data)."""
         if key.startswith('_'):
+            if key == '_children' and self._lazy is not None:
+                # child nodes are not yet restored from checkpoint
+                from .checkpoint import load_children
+                load_children(self)
+
             return object.__getattribute__(self, key)
 
         if key in self._data:
-            return self._data[key]
+            val = self._data[key]
+
+        elif key in self._init:
+            val = self._init[key]
+
+        else:
+            if key not in gethints() and self._parent:
+                return self._parent.__getattr__(key)
 
-        if key in self._init:
-            return self._init[key]
+            return None
 
-        if key not in tp.get_type_hints(Node) and self._parent:
-            return self._parent.__getattr__(key)
+        if val is ... and self._blob is not None:
+            # value is not yet loaded from checkpoint
+            self._expand()
+            return self.__getattr__(key)
 
-        return None
+        return val
 
     def __setattr__(self, key: str, val):
         """Set node data."""
+        global _generation
+
         if key.startswith('_'):
             object.__setattr__(self, key, val)
 
+            if key not in _transient:
+                _generation += 1
+
         else:
+            self._expand()
             self._data[key] = val
+            _generation += 1
 
     def __getstate__(self):
         """Items to be saved when pickled."""
+        self._expand()
         state = {}
 
-        for key in tp.get_type_hints(Node):
-            if key.startswith('_') and key != '_executing_async':
+        for key in gethints():
+            if key.startswith('_') and key not in _transient:
                 state[key] = getattr(self, key)
 
         return state
@@ -190,6 +303,12 @@ class Node(Directory):
         for key, val in state.items():
             setattr(self, key, val)
 
+    def _expand(self):
+        """Load node data that are not yet loaded from checkpoint."""
+        if self._blob is not None:
+            from .checkpoint import expand
+            expand(self)
+
     def __getitem__(self, key: int) -> Node:
         """Get child node."""
         return self._children[key]
@@ -204,26 +323,36 @@ class Node(Directory):
 
     def __str__(self):
         """Node name with execution state."""
-        from .root import root
+        return self._getstatus(None)
 
-        name = self.name
+    def _getstatus(self, cache: dict | None) -> str:
+        """Get str(self), elapsed time of child nodes are stored in cache if not None."""
+        name = base = self.name
 
         if self._err:
             name += ' (failed)'
 
+        elif self._cancelled:
+            name += ' (cancelled)'
+
         elif self._starttime:
             if self._endtime:
-                if elapsed := self.elapsed:
+                if elapsed := self._getelapsed(cache):
                     # task done
                     delta = str(timedelta(seconds=int(round(elapsed))))
 
                     if delta.startswith('0:'):
                         delta = delta[2:]
 
+                    if self._archived is not None:
+                        delta += f', {self._archived["nodes"]} nodes archived'
+
                     name += f' ({delta})'
 
             else:
                 # task started but not finished
+                from .root import root
+
                 if root.job.paused:
                     name += ' (terminated)'
 
@@ -232,21 +361,16 @@ class Node(Directory):
                         # MPI task not yet allocated
                         name += ' (pending)'
 
-                    elif self.prober:
-                        try:
-                            state = self.prober(self) if getnargs(self.prober) > 0 else self.prober()
-
-                            if isinstance(state, float):
-                                name += f' ({int(state*100)}%)'
+                    elif (state := self._probed) is not None:
+                        # cached value of self.prober so that printing status does not run user code
+                        if isinstance(state, float):
+                            name += f' ({int(state*100)}%)'
 
-                            else:
-                                name += f' ({state})'
-
-                        except:
-                            pass
+                        else:
+                            name += f' ({state})'
 
-                    if name == self.name:
-                        if root.ping_interval and time() - (root._init.get('_ping') or 0) > root.ping_interval + (root.save_interval or 0) + 10:
+                    if name == base:
+                        if root.ping_interval and time() - root._lastping() > root.ping_interval + (root.save_interval or 0) + 10:
                             # job exited unexpectedly
                             name += ' (not running)'
 
@@ -277,8 +401,11 @@ class Node(Directory):
     async def _exec_task(self):
         """Execute self.task."""
         from .root import root
+        from .retry import getfailure, getpolicy, FATAL
+        from .trace import emit
+        from .profiling import profile
 
-        if self._endtime:
+        if self._endtime or self._cancelled:
             return
 
         self.mkdir()
@@ -291,25 +418,15 @@ class Node(Directory):
         self._dispatchtime = None
         self._endtime = None
         self._err = None
+        self._probed = None
         self._data.clear()
         root.checkpoint()
 
-        retry = 0
-        retry_delay = 1
-
-        if isinstance(self.retry, int):
-            retry = self.retry
+        # number of retries used by each class of failures
+        retries: tp.Dict[str | None, int] = {}
+        itry = 0
 
-        elif isinstance(self.default_retry, int):
-            retry = self.default_retry
-        
-        if isinstance(self.retry_delay, (int, float)):
-            retry_delay = self.retry_delay
-        
-        if retry < 0:
-            retry = 0
-
-        for itry in range(retry + 1):
+        while True:
             try:
                 # import task
                 task = self.task
@@ -334,35 +451,79 @@ class Node(Directory):
                 if itry > 0:
                     msg += f' (retry {itry})'
                 print(msg)
+                emit('start', self, retry=itry)
 
                 if task:
                     # set default argument
                     if args is None:
                         args = [self] if getnargs(task) > 0 else ()
 
-                    # call task function
-                    if (result := task(*args)) and asyncio.iscoroutine(result):
-                        await result
+                    # call task function (MPI tasks are profiled in MPI processes, coroutines are not profiled
+                    # because the profiler would record all tasks running in the event loop)
+                    profiler = None if self._is_mpi or asyncio.iscoroutinefunction(task) else self.profiler
+
+                    with profile(profiler, self.path(self.name.replace('/', '_'))):
+                        result = task(*args)
+
+                    if result and asyncio.iscoroutine(result):
+                        self._executing = asyncio.ensure_future(result)
+                        await self._executing
+
+            except asyncio.CancelledError:
+                if not self._cancelled:
+                    # cancelled by event loop instead of node.cancel()
+                    raise
+
+                # state is recorded by node.cancel()
+                break
 
             except Exception as e:
                 from traceback import format_exc
 
                 if isinstance(e, InsufficientWalltime):
-                    root._signal()
+                    if not root.job._draining and not root.job._deferred:
+                        root._signal()
+
                     return
 
                 print(format_exc(), file=stderr)
 
-                if itry < retry:
-                    await asyncio.sleep(retry_delay)
+                if self._cancelled:
+                    # task failed after being cancelled by itself, state is recorded by node.cancel()
+                    break
+
+                # retry based on the class of failure
+                failure = getfailure(e, self)
+                policy = getpolicy(failure, self)
+                nretry = retries.get(failure, 0)
+
+                if nretry < policy.retry:
+                    retries[failure] = nretry + 1
+                    itry += 1
+                    delay = policy.getdelay(nretry)
+                    emit('retry', self, failure=failure, delay=round(delay, 3))
+
+                    # delay can be interrupted by node.cancel()
+                    self._executing = asyncio.ensure_future(asyncio.sleep(delay))
+
+                    try:
+                        await self._executing
+
+                    except asyncio.CancelledError:
+                        if not self._cancelled:
+                            raise
+
+                        break
+
                     continue
 
                 self._starttime = None
                 self._dispatchtime = None
                 self._err = e
+                emit('fail', self, failure=failure)
 
-                if err or root.job.debug:
-                    # job failed twice or job in debug mode
+                if err or root.job.debug or failure == FATAL:
+                    # job failed twice, job in debug mode or failure cannot be resolved by requeue
                     root.job.aborted = True
 
                 else:
@@ -371,7 +532,12 @@ class Node(Directory):
 
             else:
                 self._endtime = time()
-                break
+                emit('end', self)
+
+            finally:
+                self._executing = None
+
+            break
 
         root.checkpoint()
 
@@ -415,13 +581,19 @@ class Node(Directory):
                 exclude.append(wss[0])
                 await wss[0].execute()
 
+                if (root.job._draining or root.job._deferred) and not wss[0].done:
+                    # do not start next node before previous node is finished in the requeued job
+                    break
+
             # exit if any error occurs
             if root.job.failed or root.job.aborted:
                 break
 
     def update(self, items: dict):
         """Update properties from dict."""
+        self._expand()
         self._data.update(items)
+        touch()
 
     def add(self, task: Task | None = None, /,
         cwd: str | None = None, name: str | None = None, *,
@@ -433,13 +605,15 @@ class Node(Directory):
             task (Task | None, optional): Task to be executed. Defaults to None.
             cwd (str | None, optional): Working directory of the child node. Defaults to None.
             name (str | None, optional): Name of the child node. If is None, name will be determined by task. Defaults to None.
-            retry (int | None, optional): Number of time the task is retried.
+            retry (int | None, optional): Number of time the task is retried, overrides the retry policy
+                of every class of failures except fatal failures. Defaults to None.
             args (list | tuple | None, optional): Arguments passed to task function. Defaults to None.
             concurrent (bool | None, optional): The child node will execute its child nodes concurrently. Defaults to None.
             prober (tp.Callable[..., float  |  str  |  None] | None, optional): Function that probes the execution status of the node.
                 If returns a float, the value is the task progress (0 to 1).
                 If returns a str, the value is arbitary task status string.
-                Defaults to None.
+                The prober is evaluated in a separate thread, so it should only read files and data of the node
+                and its child nodes, not deeper nodes that may be restored from checkpoint when accessed. Defaults to None.
 
         Returns:
             Node: The child node added.
@@ -471,6 +645,7 @@ class Node(Directory):
             node._name = cwd
 
         self._children.append(node)
+        touch()
 
         if isinstance(self._executing_async, list):
             self._executing_async.append((asyncio.create_task(node.execute()), node))
@@ -486,7 +661,8 @@ class Node(Directory):
         cwd: str | None = None, data: dict | None = None,
         timeout: tp.Literal['auto'] | float | None = 'auto',
         ontimeout: tp.Literal['raise'] | tp.Callable[[], None] | None = 'raise',
-        priority: int = 0, exec_args: tp.Dict[tp.Type[Job], str] | None = None, retry: int | None = None) -> Node:
+        priority: int = 0, exec_args: tp.Dict[tp.Type[Job], str] | None = None, retry: int | None = None,
+        memory_per_proc: float | None = None, speculative: float | None = None, checkpoint: dict | None = None) -> Node:
         """Add a child node that executed an MPI task.
 
         Args:
@@ -523,6 +699,24 @@ class Node(Directory):
                 Values of the dict are the arguments, and will be ignored if root.job is not a subclass of its key.
                 e.g. {Slurm: '--cpu-freq=low', LSF: '--memory_per_rs 200'} means that '--cpu-freq=low' will be passed to Slurm clusters
                 and '--memory_per_rs 200' will be passed to LSF clusters. Defaults to None.
+            retry (int | None, optional): Number of time the task is retried, overrides the retry policy
+                of every class of failures except fatal failures. Defaults to None.
+            memory_per_proc (float | None, optional): Memory of an MPI process in MB.
+                If root.job.memory_per_node is set, memory is considered when scheduling MPI tasks.
+                The value is also passed to the job system (e.g. --mem-per-cpu for Slurm). Defaults to None.
+            speculative (float | None, optional): Quantile (0 to 1) of the runtimes of finished sibling MPI tasks.
+                If the runtime of the task exceeds this value and resource is available, a duplicate of the task
+                is launched in a scratch directory with links to the files in the task directory,
+                the one that finishes first is used and the other one is terminated.
+                New output files of the duplicate are moved back to the task directory. Input directories are linked
+                as well, so the task should not write into directories that exist before it starts.
+                Only supported for shell commands with use_multiprocessing=False. Defaults to None.
+            checkpoint (dict | None, optional): Checkpoint protocol of a long task (see nnodes.restart.Checkpoint).
+                Some minutes before the walltime runs out, a signal is sent to the task, which is expected to write
+                a restart file and exit. The job is then requeued and the restarted task receives the path of
+                the restart file in NNODES_RESTART (and optionally as a command line argument),
+                e.g. {'file': 'solver.chk', 'signal': 'SIGUSR1', 'lead': 10, 'arg': '--restart {}'}.
+                Only used if timeout is 'auto', cannot be combined with speculative. Defaults to None.
 
         Returns:
             Node: The child node added that executes the MPI task.
@@ -536,50 +730,235 @@ class Node(Directory):
         if mps and gpus_per_proc != 0:
             print('warning: gpus_per_proc is ignored because mps is set')
 
+        if speculative and (callable(cmd) or isinstance(cmd, (list, tuple)) or use_multiprocessing):
+            # Python functions and multiprocessing tasks run in the node directory and cannot be duplicated
+            raise ValueError('speculative is only supported for shell commands without multiprocessing')
+
+        if speculative and root.lease_dir:
+            print('warning: speculative is ignored because tasks are shared through root.lease_dir')
+
+        if speculative and checkpoint:
+            # only the original process would be signaled to write a restart file
+            raise ValueError('checkpoint cannot be combined with speculative')
+
         func = partial(mpiexec, cmd, nprocs, cpus_per_proc, gpus_per_proc, mps, fname or name,
-            args, mpiarg, group_mpiarg, check_output, use_multiprocessing, timeout, ontimeout, priority, exec_args)
+            args, mpiarg, group_mpiarg, check_output, use_multiprocessing, timeout, ontimeout, priority, exec_args,
+            memory_per_proc=memory_per_proc, speculative=speculative, checkpoint=checkpoint)
         node = self.add(func, cwd, name or fname or getname(cmd), retry=retry, **(data or {}))
         node._is_mpi = True
 
         return node
 
+    def cancel(self):
+        """Cancel pending and running tasks of the node and its child nodes.
+
+        Running subprocesses are terminated and resources held in mpiexec are freed immediately.
+        Nodes that are already done are not affected.
+        """
+        from .root import root
+        from .trace import emit
+
+        now = time()
+        nodes: tp.List[Node] = [self]
+
+        while len(nodes):
+            node = nodes.pop()
+
+            if node.done:
+                continue
+
+            node._cancelled = True
+
+            if node._starttime and not node._endtime:
+                node._endtime = now
+                emit('cancel', node)
+
+            if node._executing and node._executing is not asyncio.current_task():
+                # a task cannot cancel itself, it will exit normally
+                node._executing.cancel()
+
+            nodes.extend(node._children)
+
+        root.checkpoint()
+
+    def archive(self, dst: str | None = None):
+        """Move the child nodes of a finished node to an archive file to reduce memory and checkpoint size.
+
+        The node keeps a summary (total walltime and number of archived, failed and cancelled nodes)
+        that is shown in the status of the node.
+
+        Args:
+            dst (str | None, optional): Path of the archive file relative to node directory.
+                Defaults to archive_<node id>.pickle, e.g. archive_0_3.pickle for root[0][3]
+                (nodes without cwd share the directory of their parent node).
+
+        Raises:
+            RuntimeError: Node is not finished.
+            FileExistsError: Archive file already exists.
+        """
+        from .root import root
+        from .checkpoint import archive
+        from .trace import nodeid
+
+        if not self.done:
+            raise RuntimeError(f'cannot archive {self.name} because it is not finished')
+
+        if self._archived is None and (self._lazy is not None or len(self)):
+            if dst is None:
+                idx = nodeid(self)
+                dst = f'archive_{idx.replace("/", "_")}.pickle' if idx else 'archive.pickle'
+
+            if self.has(dst):
+                raise FileExistsError(f'cannot archive {self.name} because {self.path(dst)} already exists')
+
+            archive(self, dst)
+            root.checkpoint()
+
+    def unarchive(self):
+        """Restore the child nodes moved to an archive file by node.archive() and remove the archive file."""
+        from .root import root
+        from .checkpoint import unarchive
+
+        if self._archived is not None:
+            src = self._archived['file']
+            unarchive(self)
+
+            # archive file is only removed after restored child nodes are saved
+            root.save()
+            self.rm(src)
+
     def reset(self):
         """Reset node (including child nodes)."""
+        from .restart import discard
+
+        discard(self)
+
+        # archive files of the subtree are no longer referenced
+        stack: tp.List[Node] = [self]
+
+        while len(stack):
+            node = stack.pop()
+
+            if node._archived is not None and node.has(node._archived['file']):
+                node.rm(node._archived['file'])
+
+            if node._lazy is None:
+                stack.extend(node._children)
+
         self._starttime = None
         self._dispatchtime = None
         self._endtime = None
         self._err = None
+        self._cancelled = False
+        self._archived = None
+        self._probed = None
         self._data.clear()
         self._children.clear()
+        touch()
 
-    def stat(self, verbose: bool = False):
-        """Structure and execution status."""
-        stat = str(self)
+    def stat(self, verbose: bool = False, *, depth: int | None = None, width: int | None = None,
+        only: tp.Collection[str] | None = None) -> str:
+        """Structure and execution status.
 
-        if not verbose:
-            stat = stat.split(' ')[0]
+        Args:
+            verbose (bool, optional): Expand finished and pending child nodes. Defaults to False.
+            depth (int | None, optional): Maximum depth of child nodes to print. Defaults to None.
+            width (int | None, optional): Maximum number of child nodes to print under each node. Defaults to None.
+            only (tp.Collection[str] | None, optional): Only print nodes in given states ('failed', 'running' or 'pending')
+                and their parent nodes. Defaults to None.
 
-        def idx(j):
-            if self.concurrent:
-                return '- '
+        Returns:
+            str: Execution status of node and child nodes.
+        """
+        return '\n'.join(self.iterstat(verbose, depth=depth, width=width, only=only))
+
+    def iterstat(self, verbose: bool = False, *, depth: int | None = None, width: int | None = None,
+        only: tp.Collection[str] | None = None) -> tp.Iterator[str]:
+        """Iterate lines of self.stat() so that status of a large tree can be printed while rendering (see self.stat)."""
+        # cache of done and elapsed of nodes, so that each subtree is only visited once
+        cache: dict = {}
+        shown = None if only is None else _filter(self, only, cache)
+
+        def push(node: Node):
+            # child nodes are numbered unless node is concurrent
+            stack.append((node, enumerate(node), [False, 0, bool(node.concurrent), len(str(len(node) - 1))]))
+
+        stat = self._getstatus(cache)
+        yield stat if verbose else stat.split(' ')[0]
+
+        # nodes being expanded, their child node iterators and state (whether remaining child nodes are collapsed,
+        # number of child nodes printed, whether node is concurrent and number of digits of child node index)
+        stack: tp.List[tp.Tuple[Node, tp.Iterator[tp.Tuple[int, Node]], tp.List[tp.Any]]] = []
+        push(self)
+
+        while len(stack):
+            parent, children, state = stack[-1]
+            level = len(stack)
+            indent = '  ' * (level - 1)
+
+            for i, node in children:
+                if shown is not None and node not in shown:
+                    continue
+
+                if width is not None and state[1] >= width:
+                    nmore = sum(1 for n in parent._children[i:] if shown is None or n in shown)
+                    yield indent + f'... {nmore} more'
+                    stack.pop()
+                    break
+
+                state[1] += 1
+                prefix = indent + ('- ' if state[2] else str(i).zfill(state[3]) + ') ')
+
+                if shown is not None:
+                    expand = any(child in shown for child in node)
 
-            return '0' * (len(str(len(self) - 1)) - len(str(j))) + str(j) + ') '
+                elif not verbose and (node._isdone(cache) or (state[0] and node._starttime is None)):
+                    expand = False
 
-        collapsed = False
+                else:
+                    state[0] = True
+                    expand = len(node) > 0
 
-        for i, node in enumerate(self):
-            stat += '\n' + idx(i)
+                if expand and (depth is None or level < depth):
+                    stat = node._getstatus(cache)
+                    yield prefix + (stat if verbose else stat.split(' ')[0])
+                    push(node)
+                    break
 
-            if not verbose and (node.done or (collapsed and node._starttime is None)):
-                stat += str(node)
+                yield prefix + node._getstatus(cache)
 
             else:
-                collapsed = True
+                stack.pop()
 
-                if len(node):
-                    stat += '\n  '.join(node.stat(verbose).split('\n'))
 
-                else:
-                    stat += str(node)
+def _filter(node: Node, only: tp.Collection[str], cache: dict) -> tp.Set[Node]:
+    """Nodes in given states and their parent nodes (finished nodes are skipped without loading child nodes)."""
+    shown: tp.Set[Node] = set()
+    stack = [node]
+
+    while len(stack):
+        n = stack.pop()
+
+        if n._isdone(cache):
+            continue
+
+        if n._err:
+            state = 'failed'
+
+        elif n._starttime and not n._endtime and not n._cancelled:
+            state = 'pending' if n._is_mpi and n._dispatchtime is None else 'running'
+
+        else:
+            state = None
+
+        if state in only:
+            # mark node and its parent nodes
+            p: Node | None = n
+
+            while p is not None and p not in shown and p is not node:
+                shown.add(p)
+                p = p._parent
+
+        stack.extend(n)
 
-        return stat
+    return shown
@@ -0,0 +1,134 @@
+from __future__ import annotations
+import sys
+import asyncio
+import typing as tp
+from os import path, remove, getpid
+from math import ceil
+from time import time
+
+from .root import root
+
+
+# worker allocations submitted by the workflow, pilot id -> job id from the scheduler
+_pilots: tp.Dict[str, str] = {}
+
+# task scaling worker allocations
+_background: asyncio.Task | None = None
+
+# number of worker allocations submitted by the workflow
+_nsubmitted = 0
+
+# interval (in seconds) between scaling decisions, tasks pending for a shorter time are not counted
+_interval = 10.0
+
+
+def _state(pid: str) -> str:
+    """State of a worker allocation: 'queued', 'running' or 'exited'."""
+    from .lease import _path
+
+    if path.exists(_path('pilots', f'{pid}.exit')):
+        return 'exited'
+
+    try:
+        if time() - path.getmtime(_path('pilots', pid)) > root.lease_timeout:
+            # worker is killed without notifying the workflow
+            return 'exited'
+
+        return 'running'
+
+    except FileNotFoundError:
+        return 'queued'
+
+
+def _demand() -> int:
+    """Number of worker allocations required to execute pending tasks."""
+    from .lease import pending
+
+    job = root.job
+    total = 0.0
+
+    for res in pending(_interval):
+        if isinstance(res, int):
+            if res <= job.mp_nprocs_max:
+                total += res / job.mp_nprocs_max
+
+        elif (n := max(res)) <= tp.cast(int, job.pilot_nnodes):
+            # tasks larger than a worker allocation can only be executed by current job
+            total += n / tp.cast(int, job.pilot_nnodes)
+
+    return ceil(total)
+
+
+def _submit():
+    """Submit a worker allocation that runs nnwork."""
+    global _nsubmitted
+
+    _nsubmitted += 1
+    job = root.job
+    pid = f'pilot.{getpid()}.{_nsubmitted}'
+    walltime = job.pilot_walltime or job.walltime
+    cmd = f'cd {root.path()} && {sys.executable} -m nnodes.scripts.nnwork ' \
+        f'--nnodes {job.pilot_nnodes} --walltime {walltime} --idle {job.pilot_idle} --pilot {pid}'
+
+    _pilots[pid] = job.submit(cmd, tp.cast(int, job.pilot_nnodes), walltime, f'{job.name or "nnodes"}_{pid}')
+
+
+def _remove(pid: str):
+    """Stop tracking a worker allocation."""
+    from .lease import _path
+
+    del _pilots[pid]
+
+    for src in (_path('pilots', pid), _path('pilots', f'{pid}.exit')):
+        if path.exists(src):
+            remove(src)
+
+
+async def _scale():
+    """Submit worker allocations for pending tasks and cancel queued allocations that are no longer needed."""
+    job = root.job
+
+    while True:
+        await asyncio.sleep(_interval)
+
+        # allocations waiting in the scheduler queue
+        queued = []
+
+        for pid in list(_pilots):
+            if (state := _state(pid)) == 'exited':
+                _remove(pid)
+
+            elif state == 'queued':
+                queued.append(pid)
+
+        if (demand := _demand()) == 0:
+            for pid in queued:
+                job.cancel(_pilots[pid])
+                _remove(pid)
+
+        else:
+            for _ in range(min(demand - len(queued), job.pilot_max - len(_pilots))):
+                _submit()
+
+
+def start():
+    """Start scaling worker allocations (called from Root.execute)."""
+    global _background
+
+    if root.lease_dir and root.job.pilot_nnodes and _background is None:
+        _background = asyncio.create_task(_scale())
+
+
+def stop():
+    """Stop scaling and cancel queued worker allocations, running allocations exit after the workflow is closed."""
+    global _background
+
+    if _background is not None:
+        _background.cancel()
+        _background = None
+
+        for pid in list(_pilots):
+            if _state(pid) == 'queued':
+                root.job.cancel(_pilots[pid])
+
+            _remove(pid)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+import typing as tp
+from os import path
+from glob import glob
+from contextlib import contextmanager
+
+from .node import parse_import
+
+if tp.TYPE_CHECKING:
+    from pstats import Stats
+
+
+# a profiler is running in current process (only one profiler can be active at a time)
+_active = False
+
+
+@contextmanager
+def cprofile(dst: str):
+    """Profile with cProfile and write to <dst>.prof."""
+    from cProfile import Profile
+
+    prof = Profile()
+    prof.enable()
+
+    try:
+        yield
+
+    finally:
+        prof.disable()
+        prof.dump_stats(dst + '.prof')
+
+
+@contextmanager
+def tracemalloc(dst: str):
+    """Trace memory allocations and write snapshot to <dst>.mem."""
+    import tracemalloc as tm
+
+    started = not tm.is_tracing()
+
+    if started:
+        tm.start()
+
+    try:
+        yield
+
+    finally:
+        tm.take_snapshot().dump(dst + '.mem')
+
+        if started:
+            tm.stop()
+
+
+# built-in profilers
+profilers: tp.Dict[str, tp.Callable[[str], tp.ContextManager]] = {'cprofile': cprofile, 'tracemalloc': tracemalloc}
+
+
+@contextmanager
+def profile(profiler: str | tp.List[str] | None, dst: str):
+    """Run code with a profiler.
+
+    Args:
+        profiler (str | tp.List[str] | None): Name of a built-in profiler ('cprofile' or 'tracemalloc')
+            or import path of a function that takes dst and returns a context manager.
+            Profiling is skipped if profiler is None or another profiler is running.
+        dst (str): Path of the output file without extension.
+    """
+    global _active
+
+    if not profiler:
+        yield
+        return
+
+    if _active:
+        print(f'warning: {dst} is not profiled because another profiler is running')
+        yield
+        return
+
+    hook = profilers[profiler] if isinstance(profiler, str) else parse_import(profiler)
+    _active = True
+
+    try:
+        with hook(dst):
+            yield
+
+    finally:
+        _active = False
+
+
+def aggregate(src: str = '.', dst: str | None = None) -> Stats:
+    """Merge cProfile outputs of all tasks and MPI ranks under a directory.
+
+    Args:
+        src (str, optional): Directory to search for *.prof files. Defaults to '.'.
+        dst (str | None, optional): Save merged profile to file. Defaults to None.
+
+    Returns:
+        Stats: Merged profile.
+    """
+    from pstats import Stats
+
+    files = sorted(glob(path.join(src, '**', '*.prof'), recursive=True))
+
+    if len(files) == 0:
+        raise FileNotFoundError(f'no profile found in {src}')
+
+    stats = Stats(*files)
+
+    if dst:
+        stats.dump_stats(dst)
+
+    return stats
+
+
+def aggregate_memory(src: str = '.', limit: int = 20) -> tp.List[tp.Tuple[str, int, int]]:
+    """Merge tracemalloc snapshots of all tasks and MPI ranks under a directory.
+
+    Args:
+        src (str, optional): Directory to search for *.mem files. Defaults to '.'.
+        limit (int, optional): Number of entries to return. Defaults to 20.
+
+    Returns:
+        tp.List[tp.Tuple[str, int, int]]: Source line, total size and number of blocks allocated, sorted by size.
+    """
+    from tracemalloc import Snapshot
+
+    total: tp.Dict[str, tp.List[int]] = {}
+
+    for f in glob(path.join(src, '**', '*.mem'), recursive=True):
+        for stat in Snapshot.load(f).statistics('lineno'):
+            key = str(stat.traceback)
+            entry = total.setdefault(key, [0, 0])
+            entry[0] += stat.size
+            entry[1] += stat.count
+
+    return sorted(((key, *val) for key, val in total.items()), key=lambda e: e[1], reverse=True)[:limit] # type: ignore
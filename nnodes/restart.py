@@ -0,0 +1,119 @@
+from __future__ import annotations
+import signal
+import asyncio
+import typing as tp
+from os import path, killpg
+from time import time
+from functools import partial
+
+from .directory import Directory, terminate
+
+if tp.TYPE_CHECKING:
+    from asyncio.subprocess import Process
+    from .node import Node
+
+
+class Checkpoint:
+    """Checkpoint protocol of an MPI task that writes a restart file when signaled (see Node.add_mpi)."""
+    # file written by the application when it receives the signal, relative to the directory of the task
+    file: str = 'restart'
+
+    # signal sent to the process group of the task to request a restart file (name or number)
+    signal: str | int = 'SIGUSR1'
+
+    # minutes before the walltime (minus gap) runs out to send the signal
+    lead: float = 5.0
+
+    # environment variable set to the absolute path of the restart file when the task is restarted
+    env: str = 'NNODES_RESTART'
+
+    # argument appended to shell commands when the task is restarted, {} is replaced by the path of the restart file
+    arg: str | None = None
+
+    def __init__(self, config: dict):
+        for key, val in config.items():
+            setattr(self, key, val)
+
+    def getrestart(self, d: Directory) -> str | None:
+        """Absolute path of the restart file written in a previous run, None if the task starts from scratch."""
+        if d.has(self.file):
+            return d.path(self.file, abs=True)
+
+        return None
+
+    def clear(self, d: Directory):
+        """Remove the restart file so that the task starts from scratch when executed again."""
+        if d.has(self.file):
+            d.rm(self.file)
+
+    async def wait(self, wait: tp.Awaitable[int], process: Process, d: Directory, timeout: float) -> int:
+        """Wait for a task and request a restart file before timeout.
+
+        Args:
+            wait (tp.Awaitable[int]): Coroutine that returns the exit code of the task.
+            process (Process): Process of the task, created with start_new_session=True.
+            d (Directory): Directory of the task.
+            timeout (float): Time (in seconds) until the walltime runs out.
+
+        Raises:
+            asyncio.TimeoutError: Restart file is written or the task did not exit before timeout.
+
+        Returns:
+            int: Exit code of the task if it finished before being signaled or without writing a restart file.
+        """
+        from .trace import emit
+
+        deadline = time() + timeout
+        fut = asyncio.ensure_future(wait)
+
+        try:
+            done, _ = await asyncio.wait([fut], timeout=max(timeout - self.lead * 60, 0))
+
+            if not done:
+                # ask the application to write a restart file and exit
+                signaled = time()
+                sig = signal.Signals[self.signal] if isinstance(self.signal, str) else self.signal
+                emit('checkpoint', d)
+
+                try:
+                    killpg(process.pid, sig)
+
+                except ProcessLookupError:
+                    pass
+
+                done, _ = await asyncio.wait([fut], timeout=max(deadline - time(), 0))
+
+                if not done or self._written(d, signaled):
+                    # task is interrupted and should continue in the next job
+                    raise asyncio.TimeoutError('task interrupted before walltime runs out')
+
+            return fut.result()
+
+        finally:
+            if not fut.done():
+                terminate(process)
+                fut.cancel()
+
+    def _written(self, d: Directory, t: float) -> bool:
+        """Whether the restart file is written after a given time."""
+        try:
+            return path.getmtime(d.path(self.file)) >= t - 1
+
+        except FileNotFoundError:
+            return False
+
+
+def discard(node: Node):
+    """Remove restart files of unfinished MPI tasks in a subtree (called from Node.reset)."""
+    stack = [node]
+
+    while len(stack):
+        n = stack.pop()
+
+        # tasks that finished successfully already removed their restart files
+        if n._is_mpi and not n._endtime and isinstance(task := n.task, partial) and \
+            (config := task.keywords.get('checkpoint')):
+            Checkpoint(config).clear(n)
+
+        if n._lazy is None:
+            stack.extend(n._children)
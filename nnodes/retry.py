@@ -0,0 +1,138 @@
+from __future__ import annotations
+import re
+import errno
+import typing as tp
+from random import uniform
+
+from .node import parse_import
+
+if tp.TYPE_CHECKING:
+    from .node import Node
+
+
+# failure that is likely to succeed if retried (e.g. filesystem or scheduler hiccup)
+TRANSIENT = 'transient'
+
+# failure that will occur again if retried (e.g. error in task function)
+FATAL = 'fatal'
+
+# error messages of transient failures
+transient_messages = [
+    'Job step creation temporarily disabled',
+    'Unable to create step',
+    'Resource temporarily unavailable',
+    'Stale file handle',
+    'Input/output error',
+    'Socket timed out',
+    'Connection reset by peer',
+    'Transport endpoint is not connected',
+    'Communication connection failure'
+]
+
+# error codes of transient OSError
+transient_errno = {errno.EIO, errno.EAGAIN, errno.EBUSY, errno.ESTALE, errno.ETIMEDOUT, errno.ECONNRESET}
+
+# exception types of fatal failures
+fatal_errors = (ImportError, SyntaxError, NameError, TypeError, AttributeError, NotImplementedError)
+
+# default retry policies of failure classes
+default_policies: tp.Dict[str, dict] = {
+    TRANSIENT: {'retry': 3, 'delay': 10, 'backoff': 2, 'delay_max': 600, 'jitter': 0.5},
+    FATAL: {'retry': 0}
+}
+
+
+class Policy:
+    """Retry policy of a class of failures."""
+    # maximum number of retries
+    retry: int = 0
+
+    # delay before the first retry (in seconds)
+    delay: float = 1
+
+    # delay is multiplied by backoff after each retry
+    # can also be the import path of a function that takes the index of retry and delay and returns the actual delay
+    backoff: float | tp.List[str] = 1
+
+    # upper limit of delay
+    delay_max: float | None = None
+
+    # delay is randomly scaled within [1 - jitter, 1 + jitter]
+    jitter: float = 0
+
+    def __init__(self, config: dict):
+        for key, val in config.items():
+            setattr(self, key, val)
+
+    def getdelay(self, n: int) -> float:
+        """Delay before the n-th retry (starting from 0)."""
+        if isinstance(self.backoff, (list, tuple)):
+            delay = parse_import(self.backoff)(n, self.delay)
+
+        else:
+            delay = self.delay * self.backoff ** n
+
+        if self.delay_max is not None:
+            delay = min(delay, self.delay_max)
+
+        if self.jitter:
+            delay *= uniform(1 - self.jitter, 1 + self.jitter)
+
+        return max(delay, 0)
+
+
+def classify(err: Exception, node: Node) -> str | None:
+    """Default failure classifier."""
+    if isinstance(err, fatal_errors):
+        return FATAL
+
+    if isinstance(err, OSError) and err.errno in transient_errno:
+        return TRANSIENT
+
+    msg = str(err)
+
+    for pattern in transient_messages:
+        if pattern.lower() in msg.lower():
+            return TRANSIENT
+
+    # traceback from MPI processes
+    if re.search(r'^(' + '|'.join(e.__name__ for e in fatal_errors) + r'|ModuleNotFoundError): ', msg, re.M):
+        return FATAL
+
+    return None
+
+
+def getfailure(err: Exception, node: Node) -> str | None:
+    """Get the class of a failure with node.retry_classifiers and the default classifier."""
+    if node.retry_classifiers:
+        for classifier in node.retry_classifiers:
+            if (failure := parse_import(classifier)(err, node)) is not None:
+                return failure
+
+    return classify(err, node)
+
+
+def getpolicy(failure: str | None, node: Node) -> Policy:
+    """Get the retry policy of a class of failures (None for unclassified failures)."""
+    config = {}
+
+    if failure is None:
+        # unclassified failures use root.default_retry and root.retry_delay
+        if isinstance(node.default_retry, int):
+            config['retry'] = node.default_retry
+
+        if isinstance(node.retry_delay, (int, float)):
+            config['delay'] = node.retry_delay
+
+    elif failure in default_policies:
+        config.update(default_policies[failure])
+
+    if isinstance(node.retry_policy, dict) and isinstance(policy := node.retry_policy.get(failure or 'default'), dict):
+        config.update(policy)
+
+    if isinstance(node.retry, int) and failure != FATAL:
+        # retry number set by node.add() applies to every class of failures except fatal failures,
+        # which are only retried if allowed by root.retry_policy
+        config['retry'] = node.retry
+
+    return Policy(config)
@@ -2,8 +2,9 @@ from __future__ import annotations
 import typing as tp
 import signal
 import asyncio
+from os import replace
 from time import time
-from threading import Thread
+from threading import Thread, Lock, current_thread
 
 from .node import Node, parse_import
 
@@ -18,6 +19,25 @@ _last_save = 0
 # current background thread performing save operation
 _saving_in_thread: Thread | None = None
 
+# latest snapshot waiting to be written by the background thread (older snapshots are discarded)
+_pending_save: tp.Tuple[int, tp.List[tuple]] | None = None
+
+# number of snapshots taken and number of the snapshot last written to root.pickle
+_nsaved = 0
+_nwritten = 0
+
+# lock of _pending_save and _saving_in_thread
+_queue_lock = Lock()
+
+# lock of writing root.pickle
+_write_lock = Lock()
+
+# value of nnodes.node._generation when root.pickle was last saved
+_saved_generation = -1
+
+# content of heartbeat.json and the time it was read
+_heartbeat: tp.Tuple[dict | None, float] = (None, 0.0)
+
 
 class Root(Node):
     """Root node with job configuration."""
@@ -27,18 +47,48 @@ class Root(Node):
     # internal interval of calling self.save(), set to None to disable
     save_interval: int | float | None
 
-    # interval of checking if workflow is alive and update root.pickle, set to None to disable
+    # interval of writing heartbeat.json and saving changes to root.pickle, set to None to disable
     ping_interval: int | float | None
 
+    # interval of evaluating node.prober of running nodes in a separate thread, set to None to disable
+    probe_interval: int | float | None
+
     # default value of node.retry
     default_retry: int
 
     # delay before retry running a task
     retry_delay: int | float
 
-    # save to root.pickle using a separete thread
+    # retry policies of failure classes ('transient', 'fatal', 'default' or custom classes), see nnodes.retry.Policy
+    retry_policy: tp.Dict[str, dict] | None
+
+    # import paths of functions that take an exception and a node and return the class of failure
+    retry_classifiers: tp.List[tp.List[str]] | None
+
+    # save to root.pickle using a separete thread (node properties are pickled in that thread,
+    # so mutable values such as lists and dicts should be replaced instead of modified in place)
     async_save: bool
 
+    # file to record execution events (see nnodes.trace), set to None to disable
+    trace_file: str | None
+
+    # profiler of Python tasks ('cprofile', 'tracemalloc' or import path of a hook, see nnodes.profiling.profile)
+    # can also be set for a subtree with node.profiler, only synchronous functions and functions of MPI tasks are profiled,
+    # profile files are written to <node directory>/<task name> or <node directory>/<mpiexec file name>.<rank>
+    profiler: str | tp.List[str] | None
+
+    # file to append resource utilization of each job (see nnodes.mpiexec.metrics), set to None to disable
+    metrics_file: str | None
+
+    # Unix socket to serve live status to `nnlog --watch` (see nnodes.status), set to None to disable
+    status_socket: str | None
+
+    # directory on the shared filesystem to share MPI tasks with jobs running `nnwork` (see nnodes.lease), set to None to disable
+    lease_dir: str | None
+
+    # time (in seconds) after which a task claimed by a job that stopped renewing its lease is executed again
+    lease_timeout: float
+
     # MPI workspace (only available with __main__ from nnodes.mpi)
     _mpi: MPI | None = None
 
@@ -71,7 +121,8 @@ class Root(Node):
         
         if mpidir is None and self.has('root.pickle'):
             # restore from save file
-            self.__setstate__(self.load('root.pickle'))
+            from .checkpoint import restore
+            restore(self, self.load('root.pickle'))
         
         elif self.has('config.toml'):
             # load configuration
@@ -80,17 +131,21 @@ class Root(Node):
             self._init['_job'] = config['job']
             self._init['_jobstat'] = [False, False, False]
 
-            defaults = {
-                'save_interval': None,
-                'ping_interval': 60,
-                'default_retry': 0,
-                'retry_delay': 1,
-                'async_save': True
-            }
-
-            for key in defaults:
-                if key not in self._init:
-                    self._init[key] = defaults[key]
+        # defaults are also applied to root.pickle saved by a version without these options
+        defaults = {
+            'save_interval': None,
+            'ping_interval': 60,
+            'probe_interval': 10,
+            'default_retry': 0,
+            'retry_delay': 1,
+            'async_save': True,
+            'metrics_file': 'metrics.json',
+            'lease_timeout': 300
+        }
+
+        for key in defaults:
+            if key not in self._init:
+                self._init[key] = defaults[key]
 
         # create MPI object
         if mpidir:
@@ -112,26 +167,60 @@ class Root(Node):
         # requeue before job gets killed
         if self.job.inqueue:
             signal.signal(signal.SIGALRM, self._signal)
-            signal.alarm(int(self.job.remaining * 60))
+            signal.setitimer(signal.ITIMER_REAL, max(self.job.remaining * 60, 0.001))
+
+            if self.job.drain:
+                asyncio.get_running_loop().call_later(max(self.job.until_drain * 60, 0), self._drain)
+
+        from .trace import start_job, exit_job
+        from .mpiexec import summarize
+        from . import status, lease, pilot
+
+        start_job()
+        self._beat()
+
+        try:
+            await status.start()
+            lease.start()
+            pilot.start()
+            asyncio.create_task(self._ping())
+            asyncio.create_task(self._probe())
+            await super().execute()
 
-        asyncio.create_task(self._ping())
-        await super().execute()
+        finally:
+            # also release the socket, leases and worker allocations if the workflow raises
+            pilot.stop()
+            lease.stop()
+            status.stop()
+
+        exit_job()
+        summarize()
         root.save()
 
+        if (self.job._draining or self.job._deferred) and not self.job._signaled and not self.done:
+            # running tasks finished after draining or tasks are left to the next job, requeue before job gets killed
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            self.job._signaled = True
+            self.job.requeue()
+
         # requeue job if the following conditions are satisfied:
         # 1. job is allocated from job scheduler (can be requeued)
         # 2. any task failed
         # 3. no task failed twice in a row
         # 4. job is not in debug mode
-        # 5. job is not already being requeued (due to insufficient walltime)
-        if self.job.inqueue and self.job.failed and not self.job.aborted \
-            and not self.job.debug and not self.job.paused and self.job.auto_requeue != False:
+        # 5. job is not already being requeued (due to insufficient walltime or draining)
+        if self.job.inqueue and self.job.failed and not self.job.aborted and not self.job.debug \
+            and not self.job.paused and not self.job._draining and not self.job._deferred and self.job.auto_requeue != False:
             self.job.requeue()
     
     def checkpoint(self):
-        """Save with a certain limit on frequency."""
+        """Save with a certain limit on frequency, skipped if nothing changed since last save."""
+        from . import node
         global _last_save
 
+        if node._generation == _saved_generation:
+            return
+
         if self.save_interval and time() - self.save_interval < _last_save:
             return
         
@@ -140,6 +229,10 @@ class Root(Node):
     
     def save(self, async_save: bool = False):
         """Save state from event loop."""
+        from . import node
+        from .trace import flush
+        global _saved_generation
+
         if self.job._signaled:
             # job is being requeued
             return
@@ -149,40 +242,85 @@ class Root(Node):
             raise RuntimeError('cannot save root from MPI process')
         
         self._init['_ping'] = time()
+        _saved_generation = node._generation
+        flush()
 
         if async_save:
-            asyncio.create_task(self._save_with_thread())
+            self._save_with_thread()
         
         else:
-            if _saving_in_thread is not None:
-                _saving_in_thread.join()
-
             self._dump()
-    
-    async def _save_with_thread(self):
-        """Save in a separete thread."""
-        global _last_save
+
+    def _snapshot(self) -> tp.Tuple[int, tp.List[tuple]]:
+        """Copy the tree in event loop thread (see nnodes.checkpoint.snapshot)."""
+        from .checkpoint import snapshot
+        global _nsaved
+
+        _nsaved += 1
+
+        return _nsaved, snapshot(self)
+
+    def _save_with_thread(self):
+        """Save in a separete thread, pending saves are merged if the thread is busy."""
+        global _pending_save
         global _saving_in_thread
 
-        if _saving_in_thread:
-            return
+        with _queue_lock:
+            _pending_save = self._snapshot()
 
-        t = _saving_in_thread = Thread(target=self._dump)
-        t.start()
+            if _saving_in_thread is None:
+                _saving_in_thread = Thread(target=self._save_pending)
+                _saving_in_thread.start()
 
-        while t.is_alive():
-            await asyncio.sleep(1)
-            _last_save = time()
-        
-        if _saving_in_thread is t:
-            _saving_in_thread = None
+    def _save_pending(self):
+        """Write snapshots until no save is pending."""
+        global _pending_save
+        global _saving_in_thread
+
+        try:
+            while True:
+                with _queue_lock:
+                    if (snap := _pending_save) is None:
+                        _saving_in_thread = None
+                        return
+
+                    _pending_save = None
+
+                try:
+                    self._write(*snap)
+
+                except Exception:
+                    # keep saving newer snapshots (e.g. after an unpicklable value is removed)
+                    from sys import stderr
+                    from traceback import print_exc
+
+                    print_exc(file=stderr)
+
+        finally:
+            with _queue_lock:
+                if _saving_in_thread is current_thread():
+                    # thread exited unexpectedly, next save starts a new thread
+                    _saving_in_thread = None
+
+    def _write(self, n: int, nodes: tp.List[tuple]):
+        """Serialize a snapshot and write to root.pickle unless a newer snapshot is already written."""
+        from .checkpoint import serialize
+        global _nwritten
+
+        state = serialize(nodes)
+
+        with _write_lock:
+            if n > _nwritten:
+                self.dump(state, '_root.pickle', mkdir=False)
+                replace(self.path('_root.pickle'), self.path('root.pickle'))
+                _nwritten = n
 
     def _dump(self):
-        self.dump(self.__getstate__(), '_root.pickle')
-        self.mv('_root.pickle', 'root.pickle')
+        """Save to root.pickle in current thread."""
+        self._write(*self._snapshot())
 
     async def _ping(self):
-        """Periodically save to root.pickle."""
+        """Periodically write heartbeat.json and save to root.pickle if changed."""
         if not self.ping_interval:
             return
 
@@ -190,11 +328,122 @@ class Root(Node):
 
         if not self.done:
             self.checkpoint()
+            self._beat()
             asyncio.create_task(self._ping())
 
+    async def _probe(self):
+        """Periodically evaluate node.prober of running tasks and cache the results in node._probed."""
+        from .node import getnargs
+
+        if not self.probe_interval:
+            return
+
+        await asyncio.sleep(self.probe_interval)
+
+        if self.done:
+            return
+
+        # running tasks and their probers, child nodes of finished nodes are skipped
+        nodes: tp.List[Node] = []
+        probers: tp.List[tp.Callable] = []
+        stack: tp.List[Node] = [self]
+        cache: dict = {}
+
+        while len(stack):
+            node = stack.pop()
+
+            if node._isdone(cache):
+                continue
+
+            if node._starttime and not node._endtime and not node._cancelled and \
+                not (node._is_mpi and node._dispatchtime is None) and (prober := node.prober):
+                # data of the node and its child nodes is loaded from checkpoint in event loop thread
+                node._expand()
+
+                for child in node._children:
+                    child._expand()
+
+                nodes.append(node)
+                probers.append(prober)
+
+            stack.extend(node)
+
+        def evaluate(node: Node, prober: tp.Callable):
+            try:
+                return prober(node) if getnargs(prober) > 0 else prober()
+
+            except Exception:
+                return None
+
+        # probers usually read files, so they are evaluated outside of event loop
+        states = await asyncio.gather(*(asyncio.to_thread(evaluate, *args) for args in zip(nodes, probers)))
+
+        for node, state in zip(nodes, states):
+            if node._probed != state and not node._endtime:
+                node._probed = state
+
+        asyncio.create_task(self._probe())
+
+    def _beat(self):
+        """Write heartbeat.json (replaced atomically so that readers never see a partial file)."""
+        from os import getpid
+        from socket import gethostname
+        from .mpiexec import _running, _pending
+
+        if not self.ping_interval:
+            return
+
+        self.dump({
+            'time': time(),
+            'pid': getpid(),
+            'hostname': gethostname(),
+            'running': len(_running[False]) + len(_running[True]),
+            'pending': len(_pending[False]) + len(_pending[True])
+        }, '_heartbeat.json', mkdir=False)
+        replace(self.path('_heartbeat.json'), self.path('heartbeat.json'))
+
+    def heartbeat(self) -> dict | None:
+        """Read the heartbeat of the running workflow (re-read from heartbeat.json at most every second).
+
+        Returns:
+            dict | None: Time of the heartbeat, pid and hostname of the workflow process and numbers of running and pending MPI tasks.
+                None if the workflow has not written a heartbeat.
+        """
+        global _heartbeat
+
+        beat, tread = _heartbeat
+
+        if time() - tread > 1:
+            try:
+                beat = self.load('heartbeat.json')
+
+            except (OSError, ValueError):
+                beat = None
+
+            _heartbeat = (beat, time())
+
+        return beat
+
+    def _lastping(self) -> float:
+        """Time of the last heartbeat or save of the workflow."""
+        beat = self.heartbeat()
+
+        return max(beat['time'] if beat else 0, self._init.get('_ping') or 0)
+
+    def _drain(self):
+        """Stop starting new MPI tasks and requeue after running tasks finish."""
+        if self.job.inqueue and not self.job.aborted and not self.job._signaled and not self.job._draining:
+            from .mpiexec import _flush
+            from .trace import emit
+
+            # job is not paused, so that running tasks are not shown as terminated
+            self.job._draining = True
+            emit('drain')
+            _flush()
+
     def _signal(self, *_):
         """Requeue due to insufficient time."""
-        if self.inqueue and not self.job.aborted and not self.job._signaled:
+        if self.job.inqueue and not self.job.aborted and not self.job._signaled:
             self.job.paused = True
             self.save()
             self.job._signaled = True
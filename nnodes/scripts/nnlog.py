@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 from os import curdir
 from os.path import abspath
-from sys import argv, path
+from sys import path
+from argparse import ArgumentParser
 from nnodes import root
 
 
@@ -9,17 +10,118 @@ def bin():
 
     # Get Current dir
     cwd = abspath(curdir)
-    
-    # Append current working directory to system path for the import of the 
+
+    # Append current working directory to system path for the import of the
     # module that contains the workflow. In most cases, the workflow is part
     # of a package s.t. importing is not an issue. But in the case that it is
     # not we better append the path.
     if cwd not in path:
         path.append(cwd)
 
+    # Parse cmd line args, any positional argument enables detailed log
+    parser = ArgumentParser(prog='nnlog', description='Print the execution status of a workflow.')
+    parser.add_argument('verbose', nargs='*', help='print detailed log')
+    parser.add_argument('-v', '--verbose', dest='verbose_flag', action='store_true', help='print detailed log')
+    parser.add_argument('--depth', type=int, help='maximum depth of nodes to print')
+    parser.add_argument('--width', type=int, help='maximum number of child nodes to print under each node')
+    parser.add_argument('--failed', action='store_true', help='only print failed nodes')
+    parser.add_argument('--running', action='store_true', help='only print running nodes')
+    parser.add_argument('--pending', action='store_true', help='only print MPI tasks waiting for resources')
+    parser.add_argument('--watch', nargs='?', const=2, type=float, metavar='SECONDS', help='print live status every SECONDS (requires root.status_socket)')
+    parser.add_argument('--timeline', action='store_true', help='print node utilization over time (requires root.trace_file)')
+    parser.add_argument('--critical-path', action='store_true', help='print the chain of tasks that determined total walltime')
+    parser.add_argument('--profile', nargs='?', const=30, type=int, metavar='N', help='print top N functions of merged profiles (requires root.profiler)')
+    parser.add_argument('--export-trace', metavar='DST', help='export trace to Chrome trace format (requires root.trace_file)')
+    args = parser.parse_args()
+
     # Initialize root
     root.init()
 
-    # If any cmd line args are given a detailed log is printed; otherwise 
-    # only the top-level log is printed.
-    print(root.stat(len(argv) > 1))
+    # whether to print detailed log
+    verbose = len(args.verbose) > 0 or args.verbose_flag
+
+    if args.profile:
+        from nnodes.profiling import aggregate, aggregate_memory
+
+        if len(entries := aggregate_memory(root.path(), args.profile)):
+            print('memory allocated by source line:')
+
+            for line, size, count in entries:
+                print(f'  {line}: {size / 1024:.1f} KiB in {count} blocks')
+
+        try:
+            aggregate(root.path()).sort_stats('cumulative').print_stats(args.profile)
+
+        except FileNotFoundError as e:
+            print(e)
+
+        return
+
+    if args.critical_path:
+        from nnodes.analysis import report
+
+        print(report(root, verbose))
+        return
+
+    if args.timeline or args.export_trace:
+        from nnodes import trace
+
+        if not root.trace_file or not root.has(root.trace_file):
+            print('trace file not found, set trace_file in config.toml to record execution events')
+            return
+
+        events = trace.load()
+
+        if args.export_trace:
+            trace.export_chrome(events, args.export_trace)
+
+        if args.timeline:
+            print(trace.timeline(events))
+
+        return
+
+    # nodes in selected states and their parent nodes
+    only = [state for state in ('failed', 'running', 'pending') if getattr(args, state)] or None
+
+    if args.watch:
+        watch(verbose, args.depth, args.width, only, args.watch)
+        return
+
+    # If any cmd line args are given a detailed log is printed; otherwise
+    # only the top-level log is printed. Lines are printed while rendering.
+    for line in root.iterstat(verbose, depth=args.depth, width=args.width, only=only):
+        print(line)
+
+    # liveness of an unfinished workflow
+    if not root.done and (beat := root.heartbeat()):
+        from time import time
+        from datetime import timedelta
+
+        delta = timedelta(seconds=int(round(time() - beat['time'])))
+        print(f'last heartbeat {delta} ago from {beat["hostname"]} (pid {beat["pid"]}), '
+            f'{beat["running"]} MPI tasks running, {beat["pending"]} pending')
+
+
+def watch(verbose: bool, depth: int | None, width: int | None, only: list | None, interval: float):
+    """Print status received from the status server of the running workflow."""
+    from nnodes.status import request
+
+    if not root.status_socket:
+        print('status server not enabled, set status_socket in config.toml to watch a running workflow')
+        return
+
+    try:
+        for status in request(root.path(root.status_socket), verbose, depth=depth, width=width, only=only, watch=interval):
+            q = status['queue']
+
+            # clear screen and print current status
+            print('\033[H\033[J', end='')
+            print('\n'.join(status['stat']))
+            print(f'{q["tasks_running"]} tasks running ({q["nodes_running"]:.2f} / {q["nnodes"]} nodes, {q["procs_running"]} processes), '
+                f'{q["tasks_pending"]} pending ({q["nodes_pending"]:.2f} nodes, {q["procs_pending"]} processes)', flush=True)
+
+    except OSError:
+        print('status server not running')
+
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+import asyncio
+from os import curdir
+from os.path import abspath
+from sys import path
+from argparse import ArgumentParser
+from nnodes import root
+
+
+def bin():
+
+    # Get Current dir
+    cwd = abspath(curdir)
+
+    # Append current working directory to system path for the import of the
+    # module that contains the workflow (needed to unpickle Python tasks).
+    if cwd not in path:
+        path.append(cwd)
+
+    # Parse cmd line args, job config that differs from config.toml
+    parser = ArgumentParser(prog='nnwork', description='Execute MPI tasks of a workflow running in another job (requires root.lease_dir).')
+    parser.add_argument('--nnodes', type=int, help='number of nodes of current job')
+    parser.add_argument('--walltime', type=float, help='walltime of current job in minutes')
+    parser.add_argument('--idle', type=float, help='exit if no task is executed for IDLE minutes')
+    parser.add_argument('--pilot', help='id of the worker allocation submitted by the workflow (see job.pilot_nnodes)')
+    args = parser.parse_args()
+
+    # Initialize root
+    root.init()
+
+    if not root.lease_dir:
+        print('lease_dir not set in config.toml')
+        return
+
+    if args.nnodes:
+        root.job.nnodes = args.nnodes
+
+    if args.walltime:
+        root.job.walltime = args.walltime
+
+    from nnodes.lease import work
+
+    # execute tasks until the workflow is finished or walltime is used up
+    asyncio.run(work(exit_idle=True, idle=args.idle, pilot=args.pilot))
+
+
+if __name__ == '__main__':
+    bin()
@@ -0,0 +1,152 @@
+from __future__ import annotations
+import json
+import asyncio
+import typing as tp
+from os import path, remove, stat
+from stat import S_ISSOCK
+from time import time
+
+from .root import root
+
+
+# status server of the running workflow
+_server: asyncio.AbstractServer | None = None
+
+# minimum interval (in seconds) between updates sent to a client
+_interval_min = 0.1
+
+
+def getqueue() -> dict:
+    """Current MPI and multiprocessing queue of the scheduler."""
+    from .mpiexec import _running, _pending, _samples
+
+    sample = _samples[-1] if len(_samples) else (time(), 0.0, 0.0, 0, 0)
+
+    return {
+        'nnodes': root.job.nnodes,
+        'nodes_running': sample[1],
+        'nodes_pending': sample[2],
+        'procs_running': sample[3],
+        'procs_pending': sample[4],
+        'tasks_running': len(_running[False]) + len(_running[True]),
+        'tasks_pending': len(_pending[False]) + len(_pending[True])
+    }
+
+
+async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """Send status to a client, repeatedly if the client is watching."""
+    try:
+        request = json.loads(await reader.readline() or '{}')
+        watch = request.get('watch')
+
+        # lines already sent to client
+        sent: tp.List[str] = []
+
+        while True:
+            lines = list(root.iterstat(request.get('verbose', False),
+                depth=request.get('depth'), width=request.get('width'), only=request.get('only')))
+
+            # only send lines that changed since last update
+            status = {
+                'time': time(),
+                'done': root.done,
+                'queue': getqueue(),
+                'nlines': len(lines),
+                'lines': [[i, line] for i, line in enumerate(lines) if i >= len(sent) or sent[i] != line]
+            }
+
+            writer.write((json.dumps(status) + '\n').encode())
+            await writer.drain()
+            sent = lines
+
+            if not watch or status['done']:
+                break
+
+            try:
+                await asyncio.sleep(max(watch, _interval_min))
+
+            except asyncio.CancelledError:
+                # workflow exited, send the final status
+                watch = None
+
+    except (ConnectionError, ValueError):
+        pass
+
+    finally:
+        writer.close()
+
+
+async def start():
+    """Start serving status at root.status_socket."""
+    global _server
+
+    if root.status_socket and _server is None:
+        dst = root.path(root.status_socket)
+
+        try:
+            if path.exists(dst) and S_ISSOCK(stat(dst).st_mode):
+                # socket left by a workflow process that was killed
+                remove(dst)
+
+            _server = await asyncio.start_unix_server(_handle, dst)
+
+        except OSError as e:
+            # workflow runs without status server (e.g. socket path is too long or filesystem does not support sockets)
+            print(f'warning: cannot serve status at {dst}: {e}')
+
+
+def stop():
+    """Stop status server and remove socket file."""
+    global _server
+
+    if _server is not None:
+        _server.close()
+        _server = None
+
+        if path.exists(src := root.path(root.status_socket)):
+            remove(src)
+
+
+def request(src: str, verbose: bool = False, *, depth: int | None = None, width: int | None = None,
+    only: tp.Collection[str] | None = None, watch: float | None = None) -> tp.Iterator[dict]:
+    """Get status from the status server of a running workflow.
+
+    Args:
+        src (str): Path to the socket file (root.status_socket).
+        verbose (bool, optional): Expand finished and pending child nodes. Defaults to False.
+        depth (int | None, optional): Maximum depth of child nodes to print. Defaults to None.
+        width (int | None, optional): Maximum number of child nodes to print under each node. Defaults to None.
+        only (tp.Collection[str] | None, optional): Only print nodes in given states. Defaults to None.
+        watch (float | None, optional): Interval (in seconds) of receiving updates until workflow is done.
+            If is None, only the current status is received. Defaults to None.
+
+    Raises:
+        OSError: Status server is not running.
+
+    Yields:
+        dict: Time, whether workflow is done, scheduler queue (see getqueue) and status lines (see Node.stat).
+    """
+    import socket
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(src)
+        sock.sendall((json.dumps({'verbose': verbose, 'depth': depth, 'width': width,
+            'only': list(only) if only else None, 'watch': watch}) + '\n').encode())
+
+        # status lines updated incrementally
+        lines: tp.List[str] = []
+
+        for msg in sock.makefile('r'):
+            status = json.loads(msg)
+            del lines[status.pop('nlines'):]
+
+            for i, line in status.pop('lines'):
+                if i < len(lines):
+                    lines[i] = line
+
+                else:
+                    lines.append(line)
+
+            status['stat'] = list(lines)
+
+            yield status
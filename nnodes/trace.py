@@ -0,0 +1,220 @@
+from __future__ import annotations
+import json
+import typing as tp
+from os import getpid
+from time import time
+from datetime import timedelta
+from weakref import WeakKeyDictionary
+
+from .root import root
+
+if tp.TYPE_CHECKING:
+    from .node import Node
+
+
+# events that are not yet written to root.trace_file
+_buffer: tp.List[str] = []
+
+# maximum number of buffered events before writing to file
+_buffer_max = 1000
+
+# cached id of parent node and index in parent node, validated when used because child nodes can be reset or archived
+_ids: WeakKeyDictionary[Node, tp.Tuple[str, int]] = WeakKeyDictionary()
+
+
+def nodeid(node: Node) -> str:
+    """Indices from root to node joined with '/' (empty for root)."""
+    if (parent := node._parent) is None:
+        return ''
+
+    pid = nodeid(parent)
+    children = parent._children
+
+    if (cached := _ids.get(node)) is None or cached[0] != pid or \
+        not (cached[1] < len(children) and children[cached[1]] is node):
+        # index all child nodes of the parent at once instead of searching each of them
+        for i, child in enumerate(children):
+            _ids[child] = (pid, i)
+
+    # node removed from its parent keeps its last index
+    i = _ids.get(node, (pid, -1))[1]
+
+    return f'{pid}/{i}' if pid else str(i)
+
+
+def emit(ev: str, node: Node | None = None, /, **data):
+    """Record an event if root.trace_file is set.
+
+    Args:
+        ev (str): Event type (job, exit, start, retry, fail, end, cancel, queue, dispatch, release or speculate).
+        node (Node | None, optional): Node of the event. Defaults to None.
+        **data: Additional data of the event (e.g. resource held).
+    """
+    if not root.trace_file or root._mpi:
+        return
+
+    data['t'] = round(time(), 3)
+    data['ev'] = ev
+
+    if node is not None:
+        data['id'] = nodeid(node)
+        data['name'] = node.name
+
+    _buffer.append(json.dumps(data, separators=(',', ':')))
+
+    if len(_buffer) >= _buffer_max:
+        flush()
+
+
+def flush():
+    """Write buffered events to root.trace_file."""
+    if len(_buffer) and root.trace_file:
+        root.write('\n'.join(_buffer) + '\n', root.trace_file, 'a')
+        _buffer.clear()
+
+
+def load(src: str | None = None) -> tp.List[dict]:
+    """Load events from trace file (defaults to root.trace_file)."""
+    events = []
+
+    for line in root.readlines(src or root.trace_file):
+        if line:
+            events.append(json.loads(line))
+
+    return events
+
+
+def _intervals(events: tp.List[dict], start: str, end: tp.Tuple[str, ...]) -> tp.List[tp.Tuple[dict, dict]]:
+    """Pair the events of each node (e.g. dispatch and release)."""
+    opened: tp.Dict[str, dict] = {}
+    pairs = []
+
+    for e in events:
+        if 'id' not in e:
+            continue
+
+        if e['ev'] == start:
+            opened[e['id']] = e
+
+        elif e['ev'] in end and e['id'] in opened:
+            pairs.append((opened.pop(e['id']), e))
+
+    return pairs
+
+
+def export_chrome(events: tp.List[dict], dst: str):
+    """Export events to Chrome trace format (can be opened with Perfetto or chrome://tracing)."""
+    if len(events) == 0:
+        raise ValueError('trace is empty')
+
+    t0 = events[0]['t']
+    out = []
+
+    def us(t: float) -> int:
+        return int((t - t0) * 1e6)
+
+    def add(pid: int, cat: str, pairs: tp.List[tp.Tuple[dict, dict]]):
+        # assign overlapping intervals to different rows
+        rows: tp.List[float] = []
+
+        for e1, e2 in sorted(pairs, key=lambda p: p[0]['t']):
+            for tid, tend in enumerate(rows):
+                if tend <= e1['t']:
+                    break
+
+            else:
+                tid = len(rows)
+                rows.append(0)
+
+            rows[tid] = e2['t']
+            args = {key: val for key, val in e1.items() if key not in ('t', 'ev', 'name')}
+            args['result'] = e2['ev']
+            out.append({'name': e1.get('name', e1['id']), 'cat': cat, 'ph': 'X', 'ts': us(e1['t']),
+                'dur': us(e2['t']) - us(e1['t']), 'pid': pid, 'tid': tid, 'args': args})
+
+    out.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': 'tasks'}})
+    out.append({'name': 'process_name', 'ph': 'M', 'pid': 2, 'args': {'name': 'resources'}})
+    out.append({'name': 'process_name', 'ph': 'M', 'pid': 3, 'args': {'name': 'queue'}})
+    add(1, 'task', _intervals(events, 'start', ('end', 'fail', 'cancel', 'retry')))
+    add(2, 'resource', _intervals(events, 'dispatch', ('release',)))
+    add(3, 'queue', _intervals(events, 'queue', ('dispatch', 'release')))
+
+    # number of nodes and processes in use
+    for key in ('nodes', 'procs'):
+        for t, n in _utilization(events, key):
+            out.append({'name': key, 'ph': 'C', 'ts': us(t), 'pid': 2, 'args': {key: n}})
+
+    root.dump({'traceEvents': out, 'displayTimeUnit': 'ms'}, dst, 'json')
+
+
+def _utilization(events: tp.List[dict], key: str = 'nodes') -> tp.List[tp.Tuple[float, float]]:
+    """Number of nodes (key='nodes') or processes (key='procs') in use after each change."""
+    held: tp.Dict[str, float] = {}
+    steps = []
+
+    for e in events:
+        if e['ev'] == 'dispatch' and key in e:
+            held[e['id']] = e[key]
+
+        elif e['ev'] == 'release' and e.get('id') in held:
+            del held[e['id']]
+
+        elif e['ev'] in ('job', 'exit'):
+            # running tasks are killed when job exits
+            held.clear()
+
+        else:
+            continue
+
+        steps.append((e['t'], sum(held.values())))
+
+    return steps
+
+
+def timeline(events: tp.List[dict], nrows: int = 20, width: int = 40) -> str:
+    """Render node utilization (or process utilization for multiprocessing tasks) over time as text."""
+    if any(e['ev'] == 'dispatch' and 'nodes' in e for e in events):
+        key, cap = 'nodes', 'nnodes'
+
+    elif any(e['ev'] == 'dispatch' and 'procs' in e for e in events):
+        key, cap = 'procs', 'mp_nprocs_max'
+
+    else:
+        return 'no MPI task in trace'
+
+    steps = _utilization(events, key)
+
+    # total number of nodes or processes available
+    ntotal = max([e[cap] for e in events if e['ev'] == 'job' and cap in e] or [max(s[1] for s in steps)]) or 1
+
+    t0 = events[0]['t']
+    t1 = max(events[-1]['t'], t0 + 1)
+    dt = (t1 - t0) / nrows
+    lines = [f'timeline ({timedelta(seconds=int(t1 - t0))}, {ntotal} {key})']
+
+    for i in range(nrows):
+        # average number of nodes used in [b0, b1]
+        b0 = t0 + i * dt
+        b1 = b0 + dt
+        used = 0.0
+
+        for j, (t, n) in enumerate(steps):
+            tn = steps[j + 1][0] if j + 1 < len(steps) else t1
+            used += n * max(0, min(tn, b1) - max(t, b0))
+
+        used /= dt
+        bar = '#' * min(int(round(used / ntotal * width)), width)
+        lines.append(f'{str(timedelta(seconds=int(b0 - t0))):>9} |{bar:<{width}}| {used:.1f}')
+
+    return '\n'.join(lines)
+
+
+def start_job():
+    """Record the start of a job."""
+    emit('job', nnodes=root.job.nnodes, mp_nprocs_max=root.job.mp_nprocs_max, pid=getpid())
+
+
+def exit_job():
+    """Record the exit of a job and write remaining events."""
+    emit('exit')
+    flush()
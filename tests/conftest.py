@@ -0,0 +1,34 @@
+import sys
+
+import pytest
+
+from nnodes import root
+
+
+def reinit():
+    """Initialize root again from root.pickle or config.toml in current directory."""
+    # detach the tree so that files of its nodes (e.g. archives) are kept like in a new process
+    root.__dict__['_children'] = []
+    root.reset()
+    root._init.clear()
+    root.__dict__.pop('_job', None)
+    root.init()
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """Empty workflow directory with a local job, root is initialized from it."""
+    monkeypatch.chdir(tmp_path)
+    root.dump({
+        'job': {'system': ['nnodes.job', 'Local'], 'nnodes': 1, 'walltime': 100, 'mp_nprocs_max': 4},
+        'root': {'task': None, 'ping_interval': 0, 'metrics_file': ''}
+    }, 'config.toml')
+    reinit()
+
+    yield tmp_path
+
+    # background save writes to current directory, finish it before the next test changes directory
+    if (thread := sys.modules[type(root).__module__]._saving_in_thread) is not None:
+        thread.join()
+
+    root.reset()
@@ -0,0 +1,79 @@
+import asyncio
+from time import time
+
+from nnodes import root, mpiexec
+
+from conftest import reinit
+
+
+def add_finished(parent, name, runtime):
+    """Add a finished MPI node with given runtime."""
+    now = time()
+    node = parent.add(None, name=name)
+    node._is_mpi = True
+    node._starttime = now - runtime - 1
+    node._dispatchtime = now - runtime
+    node._endtime = now
+
+    return node
+
+
+def test_runtimes_from_lazy_subtree(workspace, monkeypatch):
+    group = root.add(None, name='group')
+    group._starttime = time() - 100
+    group._endtime = time()
+
+    for i in range(20):
+        add_finished(group, f'solve_{i}', 10.0 + i)
+
+    root._dump()
+    reinit()
+
+    # finished subtree is not restored until accessed
+    assert root[0]._lazy is not None
+
+    monkeypatch.setattr(mpiexec, '_runtimes', None)
+    monkeypatch.setattr(root.job, 'admission_quantile', 0.5)
+    mpiexec._record(root[0], 1.0)
+
+    assert root[0]._lazy is not None
+    assert len(mpiexec._runtimes['solve_#']) == 20
+    assert mpiexec._estimate(add_finished(root, 'solve_99', 1.0)) == 20.0
+
+
+def test_record_disabled(workspace, monkeypatch):
+    monkeypatch.setattr(mpiexec, '_runtimes', None)
+    mpiexec._record(add_finished(root, 'solve_1', 1.0), 1.0)
+
+    assert mpiexec._runtimes is None
+
+
+def test_refuse_long_task(workspace, monkeypatch):
+    monkeypatch.setattr(root.job, 'mpiexec', lambda cmd, *_, **__: cmd)
+    monkeypatch.setattr(type(root.job), 'inqueue', property(lambda _: True))
+    monkeypatch.setattr(root.job, 'admission_quantile', 0.5)
+    monkeypatch.setattr(root.job, 'requeue', lambda: requeued.append(True))
+    monkeypatch.setattr(mpiexec, '_runtimes', {'long_#': [600.0] * 3, 'short_#': [1.0] * 3})
+    requeued = []
+
+    # about 2 minutes of walltime left, a new job can run 10 minutes
+    root.job._exec_start = time() - 8 * 60
+    monkeypatch.setattr(root.job, 'walltime', 10)
+
+    group = root.add(None, name='group', concurrent=True)
+    long = group.add_mpi('true', name='long_1', use_multiprocessing=False)
+    short = group.add_mpi('true', name='short_1', use_multiprocessing=False)
+    asyncio.run(root.execute())
+
+    # only the task that does not fit is refused, the job is requeued after the shorter task finishes
+    assert long._endtime is None and short.done
+    assert root.job._deferred and not root.job._draining and requeued == [True]
+
+    # job drains if no other task can be admitted
+    root.reset()
+    long = root.add_mpi('true', name='long_2', use_multiprocessing=False)
+    root._starttime = None
+    monkeypatch.setattr(root.job, '_deferred', False)
+    monkeypatch.setattr(root.job, '_signaled', False)
+    asyncio.run(root.execute())
+    assert long._endtime is None and root.job._draining and requeued == [True, True]
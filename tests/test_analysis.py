@@ -0,0 +1,53 @@
+from nnodes import root
+from nnodes.analysis import finishtime, critical_path, slack, report
+
+
+def timed(parent, name, start, end, **data):
+    """Add a node with given start and end time."""
+    node = parent.add(None, name=name, **data)
+    node._starttime = 100.0 + start
+    node._endtime = 100.0 + end
+
+    return node
+
+
+def test_critical_path(workspace):
+    root._starttime = 100.0
+    root._endtime = 101.0
+    a = timed(root, 'a', 1, 5)
+    a._dispatchtime = 103.0
+    b = timed(root, 'b', 5, 6, concurrent=True)
+    b0 = timed(b, 'b0', 6, 16)
+    b1 = timed(b, 'b1', 6, 11)
+    c = timed(root, 'c', 16, 23)
+
+    assert finishtime(b) == 116.0 and finishtime(root) == 123.0
+
+    # only the concurrent node that finished last is in the path
+    assert critical_path(root) == [root, a, b, b0, c]
+    assert slack(root) == {root: 0, a: 0, b: 0, b0: 0, b1: 5.0, c: 0}
+
+    assert report(root, True).split('\n')[2:] == [
+        '    a 00:04 (00:02)', '    b 00:01', '      b0 00:10', '    c 00:07',
+        'slack of each node (* for nodes in the critical path):', f'* {root.name} 00:00',
+        '*   a 00:00', '*   b 00:00', '*     b0 00:00', '      b1 00:05', '*   c 00:00']
+
+    # unfinished child node is skipped
+    d = timed(c, 'd', 17, 30)
+    d._endtime = None
+    assert finishtime(d) is None and finishtime(root) == 123.0
+    assert critical_path(root) == [root, a, b, b0, c]
+    assert report(d) == 'd has not finished'
+
+
+def test_deep_tree(workspace):
+    # tree deeper than the recursion limit
+    node = root
+    root._starttime = 100.0
+    root._endtime = 101.0
+
+    for i in range(3000):
+        node = timed(node, f'n{i}', i + 1, i + 2)
+
+    assert finishtime(root) == 3101.0
+    assert len(critical_path(root)) == 3001
@@ -0,0 +1,66 @@
+import asyncio
+
+from nnodes import root
+
+
+def flaky(node):
+    """Task that always fails."""
+    root.write(f'{int(root.read("count")) + 1 if root.has("count") else 1}', 'count')
+    raise RuntimeError('flaky')
+
+
+async def slow():
+    """Task that runs until cancelled."""
+    await asyncio.sleep(30)
+
+
+async def cancel(name, delay):
+    """Cancel a child node of root after a delay."""
+    await asyncio.sleep(delay)
+    next(node for node in root if node.name == name).cancel()
+
+
+def execute(*cancels):
+    """Execute root while cancelling nodes."""
+    async def main():
+        await asyncio.gather(root.execute(), *(cancel(*args) for args in cancels))
+
+    root._init['concurrent'] = True
+    asyncio.run(main())
+
+
+def test_cancel_pending_running(workspace):
+    running = root.add(slow, name='running')
+    pending = running.add(None, name='pending')
+    execute(('running', 0.1))
+
+    assert running._cancelled and running._endtime and running._err is None
+    assert pending._cancelled and pending._starttime is None
+    assert str(running) == 'running (cancelled)' and not root.job.failed
+
+
+def test_cancel_in_backoff(workspace):
+    root._init['retry_delay'] = 1
+    node = root.add(flaky, name='flaky', retry=3)
+    execute(('flaky', 0.1))
+
+    # task is not retried after being cancelled
+    assert root.read('count') == '1'
+    assert node._cancelled and node._err is None and node._endtime
+    assert not root.job.failed and not root.job.aborted
+
+
+def test_cancel_queued_mpi(workspace, monkeypatch):
+    from nnodes import mpiexec
+
+    monkeypatch.setattr(root.job, 'nnodes', 1)
+    monkeypatch.setattr(root.job, 'mpiexec', lambda cmd, *_, **__: cmd)
+    first = root.add_mpi('sleep 30', name='first', use_multiprocessing=False)
+    queued = root.add_mpi('sleep 30', name='queued', use_multiprocessing=False)
+
+    # the second task waits for the node held by the first task
+    execute(('queued', 0.2), ('first', 0.3))
+
+    assert queued._cancelled and queued._dispatchtime is None
+    assert first._cancelled and first._dispatchtime is not None
+    assert len(mpiexec._pending[False]) == 0 and len(mpiexec._running[False]) == 0
@@ -0,0 +1,144 @@
+import sys
+
+import pytest
+
+from nnodes import root
+
+from conftest import reinit
+
+
+def finish(node, start=0.0, end=1.0):
+    """Mark a node as executed."""
+    node._starttime = start
+    node._endtime = end
+
+
+def test_roundtrip_lazy_archived(workspace):
+    lazy = root.add(None, 'lazy', name='lazy', value=[1, 2])
+    archived = root.add(None, 'archived', name='archived')
+    running = root.add(None, 'running', name='running')
+
+    for i in range(3):
+        finish(lazy.add(None, name=f'lazy{i}', index=i), i, i + 1)
+        finish(archived.add(None, name=f'archived{i}'))
+
+    finish(lazy)
+    finish(archived, 0, 5)
+    archived.archive()
+    running._starttime = 1.0
+    running.add(None, name='pending')
+    root.save()
+
+    # save again without loading the lazy subtree
+    reinit()
+    assert root[0]._lazy is not None
+    root.save()
+
+    reinit()
+    lazy, archived, running = root
+    assert lazy._lazy is not None and lazy.value == [1, 2]
+    assert [(n.name, n.index, n._endtime) for n in lazy] == [('lazy0', 0, 1), ('lazy1', 1, 2), ('lazy2', 2, 3)]
+    assert archived.elapsed == 8 and len(archived) == 0 and archived._archived['nodes'] == 3
+    assert running._endtime is None and running[0].name == 'pending'
+
+    archived.unarchive()
+    assert [n.name for n in archived] == ['archived0', 'archived1', 'archived2']
+
+
+def test_unimportable_task(workspace, monkeypatch):
+    workspace.joinpath('_missing_task.py').write_text('def run():\n    pass\n')
+    monkeypatch.syspath_prepend(str(workspace))
+    from _missing_task import run
+
+    ok = root.add(None, name='ok')
+    failed = root.add(run, name='failed')
+    finish(ok)
+    failed._starttime = 0.0
+    failed._err = RuntimeError('failed')
+    root.save()
+
+    # module of the task is removed before the workflow is restored
+    workspace.joinpath('_missing_task.py').unlink()
+    del sys.modules['_missing_task']
+    reinit()
+
+    ok, failed = root
+    assert ok.done and ok._err is None
+    assert isinstance(failed._err, ImportError) and str(failed) == 'failed (failed)'
+
+    # payload is kept so that the task can be restored after the module is available again
+    root.save()
+    workspace.joinpath('_missing_task.py').write_text('def run():\n    pass\n')
+    reinit()
+    assert isinstance(root[1]._err, RuntimeError) and root[1].task.__name__ == 'run'
+
+
+def progress(node):
+    """Prober that reads data of child nodes."""
+    return len(node[0].steps) / 4
+
+
+def test_probe_expands_in_loop(workspace, monkeypatch):
+    import asyncio
+    import threading
+    from nnodes import checkpoint
+
+    node = root.add(None, name='running', prober=progress)
+    node.add(None, steps={1, 2})
+    node._starttime = 1.0
+    root._starttime = 1.0
+    root.save()
+    reinit()
+    assert root[0]._blob is not None and root[0][0]._blob is not None
+
+    # node data is loaded in the event loop thread
+    threads = []
+    expand = checkpoint.expand
+    monkeypatch.setattr(checkpoint, 'expand', lambda n: (threads.append(threading.current_thread()), expand(n)))
+    root._init['probe_interval'] = 0.01
+    asyncio.run(root._probe())
+
+    assert threads == [threading.main_thread()] * 2 and root[0]._probed == 0.5
+
+
+def test_archive_shared_directory(workspace):
+    iters = []
+
+    # iteration nodes without cwd share the directory of root
+    for i in range(2):
+        it = root.add(None, name=f'iter{i}')
+
+        for j in range(2):
+            finish(it.add(None, name=f'iter{i}_step{j}'))
+
+        finish(it)
+        it.archive()
+        iters.append(it)
+
+    a, b = iters
+    assert a._archived['file'] != b._archived['file']
+    assert root.has('archive_0.pickle') and root.has('archive_1.pickle')
+
+    a.unarchive()
+    assert [n.name for n in a] == ['iter0_step0', 'iter0_step1']
+    assert not root.has('archive_0.pickle')
+
+    # existing archive file is not overwritten
+    root.write('', 'archive_0.pickle')
+
+    with pytest.raises(FileExistsError):
+        a.archive()
+
+    b.unarchive()
+    assert [n.name for n in b] == ['iter1_step0', 'iter1_step1']
+
+
+def test_defaults_after_restore(workspace):
+    # root.pickle of a version without probe_interval and lease_timeout
+    for key in ('probe_interval', 'lease_timeout'):
+        del root._init[key]
+
+    root.save()
+    reinit()
+
+    assert root.probe_interval == 10 and root.lease_timeout == 300
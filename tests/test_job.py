@@ -0,0 +1,86 @@
+import json
+import signal
+import asyncio
+
+from nnodes import root, job as job_module
+from nnodes.job import Simulated
+
+
+def simulated(**config) -> Simulated:
+    """Simulated job with 2 nodes and 60 minutes of walltime."""
+    config = {'nnodes': 2, 'walltime': 60, 'cpus_per_node': 4, 'gpus_per_node': 0, **config}
+
+    return Simulated(config, [False, False, False])
+
+
+def test_simulated_time(workspace):
+    job = simulated(gap=10, drain=20, speedup=100)
+
+    # 50 simulated minutes before the gap, 30 before draining
+    assert abs(job.remaining - 0.5) < 0.01
+    assert abs(job.until_drain - 0.3) < 0.01
+
+    # longest matching key is used
+    job = simulated(durations={'solve': 100, 'solve_adjoint': 300}, default_duration=50, speedup=100)
+    assert job.mpiexec('python solve_adjoint.py', 4) == 'sleep 3.000000'
+    assert job.mpiexec('python solve.py', 4) == 'sleep 1.000000'
+    assert job.mpiexec('python mesh.py', 4) == 'sleep 0.500000'
+
+
+def test_simulated_replay(workspace):
+    # durations of a previous run are averaged for each task name, configured durations take precedence
+    events = [
+        {'t': 0.0, 'ev': 'dispatch', 'id': 'a', 'name': 'solve_0'},
+        {'t': 4.0, 'ev': 'release', 'id': 'a', 'name': 'solve_0'},
+        {'t': 1.0, 'ev': 'dispatch', 'id': 'b', 'name': 'solve_0'},
+        {'t': 7.0, 'ev': 'release', 'id': 'b', 'name': 'solve_0'},
+        {'t': 1.0, 'ev': 'dispatch', 'id': 'c', 'name': 'mesh'},
+        {'t': 2.0, 'ev': 'release', 'id': 'c', 'name': 'mesh'},
+        {'t': 8.0, 'ev': 'drain'}]
+    root.writelines([json.dumps(e) for e in events], 'trace.jsonl')
+    job = simulated(replay='trace.jsonl', durations={'mesh': 30.0})
+
+    assert job.durations == {'solve_0': 5.0, 'mesh': 30.0}
+
+
+def test_simulated_requeue(workspace, monkeypatch, capsys):
+    import atexit
+
+    registered = []
+    exited = []
+    monkeypatch.setattr(atexit, 'register', lambda *args: registered.append(args))
+    monkeypatch.setattr(job_module, '_exit', exited.append)
+    monkeypatch.setattr(Simulated, '_relaunch', lambda _, n: n)
+    job = simulated(max_requeue=2)
+
+    # workflow is continued by a new process after current process exits
+    monkeypatch.setenv('NNODES_REQUEUE', '1')
+    job.requeue()
+    assert registered == [(job._relaunch, 2)] and exited == []
+
+    # job killed by the scheduler is continued immediately
+    job._signaled = True
+    job.requeue()
+    assert exited == [2]
+
+    # number of requeues is limited
+    monkeypatch.setenv('NNODES_REQUEUE', '2')
+    job.requeue()
+    assert len(registered) == 2 and exited == [2]
+    assert 'reached max_requeue (2)' in capsys.readouterr().out
+
+
+def test_simulated_workflow(workspace, monkeypatch):
+    monkeypatch.setitem(root.__dict__, '_job', simulated(durations={'slow': 200}, default_duration=10, speedup=1000))
+
+    for i in range(4):
+        root.add_mpi('fast', name=f'fast{i}', cwd=f'fast{i}', use_multiprocessing=False)
+
+    root.add_mpi('slow', name='slow', cwd='slow', use_multiprocessing=False)
+    root._init['concurrent'] = True
+    asyncio.run(root.execute())
+    signal.setitimer(signal.ITIMER_REAL, 0)
+
+    # commands are replaced with sleeps of the simulated duration
+    assert root.done
+    assert root[-1].elapsed >= 0.2 and all(node.elapsed < 0.2 for node in root[:4])
@@ -0,0 +1,122 @@
+import asyncio
+from os import path, listdir, makedirs, rename
+
+import pytest
+
+from nnodes import root, lease
+
+
+def setup(workspace, monkeypatch):
+    """Create an empty lease directory with MPI tasks run as plain shell commands."""
+    monkeypatch.setattr(root.job, 'mpiexec', lambda cmd, *_, **__: cmd)
+    monkeypatch.setattr(root.job, 'nnodes', 2)
+    monkeypatch.setattr(lease, '_poll_interval', 0.1)
+    root._init['lease_dir'] = 'lease'
+
+    for sub in lease._subdirs:
+        makedirs(lease._path(sub))
+
+    return root.subdir('task')
+
+
+def spec(cmd):
+    """Arguments of a single-process task."""
+    return {'cmd': cmd, 'cwd': None, 'fname': 'mpiexec', 'nprocs': 1, 'cpus_per_proc': 1, 'gpus_per_proc': 0,
+        'mps': None, 'memory_per_proc': None, 'use_multiprocessing': False, 'exec_args': None, 'priority': 0,
+        'timeout': None, 'estimate': None, 'env': {}}
+
+
+def test_claim_expire_reclaim(workspace, monkeypatch):
+    d = setup(workspace, monkeypatch)
+    count = path.join(workspace, 'count')
+
+    # the first job stalls, the job claiming the task again finishes immediately
+    cmd = f'n=$(cat {count} 2>/dev/null || echo 0); echo $((n+1)) > {count}; [ $n = 0 ] && sleep 30; exit 3'
+
+    async def main():
+        specs = {}
+        running = set()
+        submitted = asyncio.create_task(lease.submit(d, spec(cmd)))
+        await asyncio.sleep(0)
+
+        # lease is renewed every 2 seconds
+        root._init['lease_timeout'] = 10
+        lease._claim(specs, running)
+        first, = listdir(lease._path('leased'))
+        assert first.startswith(f'{lease._worker}.1@{lease._worker}.')
+        await asyncio.sleep(0.1)
+
+        # lease expires before it is renewed
+        root._init['lease_timeout'] = 0.3
+        poll = asyncio.create_task(lease._poll())
+
+        while not listdir(lease._path('pending')):
+            await asyncio.sleep(0.05)
+
+        # claimed again while the stalled execution still occupies a node
+        root._init['lease_timeout'] = 10
+        lease._claim(specs, running)
+        second, = listdir(lease._path('leased'))
+        assert second != first
+
+        result = await asyncio.wait_for(submitted, 5)
+        await asyncio.gather(*running)
+        poll.cancel()
+
+        return result
+
+    assert asyncio.run(main()) == (3, False)
+
+    # stalled job lost the lease and did not write a result
+    assert root.read('count').strip() == '2'
+    assert all(not listdir(lease._path(sub)) for sub in ('pending', 'leased', 'done', 'tasks'))
+    assert lease._renewals == {}
+
+
+def test_lost_lease(workspace, monkeypatch):
+    d = setup(workspace, monkeypatch)
+
+    async def main():
+        running = set()
+        submitted = asyncio.create_task(lease.submit(d, spec('sleep 30')))
+        await asyncio.sleep(0)
+
+        root._init['lease_timeout'] = 0.5
+        lease._claim({}, running)
+        name, = listdir(lease._path('leased'))
+
+        # lease is claimed again by another job, the stalled job stops at the next renewal
+        rename(lease._path('leased', name), lease._path('leased', name.split('@')[0] + '@other.1'))
+        await asyncio.wait_for(asyncio.gather(*running), 5)
+        submitted.cancel()
+
+    asyncio.run(main())
+
+    # lease of the other job is kept and no result is written
+    assert listdir(lease._path('done')) == []
+    assert listdir(lease._path('leased'))[0].endswith('@other.1')
+
+
+def test_launch_error(workspace, monkeypatch):
+    d = setup(workspace, monkeypatch)
+    task = spec('true')
+    task['cwd'] = path.join(workspace, 'missing')
+
+    async def main():
+        running = set()
+        poll = asyncio.create_task(lease._poll())
+        submitted = asyncio.create_task(lease.submit(d, task))
+        await asyncio.sleep(0)
+        lease._claim({}, running)
+
+        try:
+            # error is reported to the workflow instead of letting the lease expire
+            with pytest.raises(FileNotFoundError):
+                await asyncio.wait_for(submitted, 5)
+
+        finally:
+            poll.cancel()
+
+    asyncio.run(main())
+
+    assert all(not listdir(lease._path(sub)) for sub in ('pending', 'leased', 'done'))
@@ -0,0 +1,182 @@
+import asyncio
+from os import path
+from fractions import Fraction
+
+import pytest
+
+from nnodes import root, mpiexec
+
+
+def run(monkeypatch, nnodes=8):
+    """Execute root with MPI tasks run as plain shell commands."""
+    monkeypatch.setattr(root.job, 'nnodes', nnodes)
+    monkeypatch.setattr(root.job, 'mpiexec', lambda cmd, *_, **__: cmd)
+    root._init['concurrent'] = True
+    root._starttime = None
+    asyncio.run(root.execute())
+
+
+def test_speculative_duplicate(workspace, monkeypatch):
+    monkeypatch.setattr(mpiexec, '_speculative_interval', 0.1)
+    count = path.join(workspace, 'count')
+
+    for i in range(3):
+        root.add_mpi('echo done > result', name=f'fast{i}', cwd=f'fast{i}', use_multiprocessing=False)
+
+    # the first run is slow, the duplicate finishes immediately
+    cmd = f'n=$(cat {count} 2>/dev/null || echo 0); echo $((n+1)) > {count}; ' \
+        '[ $n = 0 ] && sleep 30; mkdir -p out; cat data/input.txt > out/input; echo $n > out/result'
+    root.write('input', 'slow/input.txt')
+    root.write('data', 'slow/data/input.txt')
+    root.add_mpi(cmd, name='slow', cwd='slow', use_multiprocessing=False, speculative=0.5)
+    run(monkeypatch)
+
+    # input directory is linked into the scratch directory of the duplicate
+    assert root.done
+    assert root.read('slow/out/result').strip() == '1'
+    assert root.read('slow/out/input') == 'data'
+    assert not root.has('slow/mpiexec.speculative')
+    assert root.read('slow/input.txt') == 'input'
+
+    # Python functions cannot be duplicated
+    with pytest.raises(ValueError):
+        root.add_mpi(['nnodes', 'root'], speculative=0.5)
+
+    with pytest.raises(ValueError):
+        root.add_mpi('true', speculative=0.5, use_multiprocessing=True)
+
+
+def nodes(n):
+    """Resource of an MPI task occupying n whole nodes."""
+    return (Fraction(n),) * 3
+
+
+def test_acquire_order(workspace, monkeypatch):
+    monkeypatch.setattr(root.job, 'nnodes', 4)
+    monkeypatch.setattr(mpiexec, '_samples', [])
+    order = []
+
+    async def task(name, n, priority=0):
+        fut = await mpiexec._acquire(nodes(n), priority)
+        order.append(name)
+        await asyncio.sleep(0.01)
+        mpiexec._release(fut)
+
+    async def main():
+        # occupy all nodes so that the following tasks are queued
+        first = await mpiexec._acquire(nodes(4), 0)
+        tasks = [asyncio.create_task(task(*args)) for args in
+            (('small', 1), ('large', 3), ('urgent', 1, 10), ('medium', 2), ('cancelled', 1, 20))]
+        await asyncio.sleep(0)
+        tasks[-1].cancel()
+        mpiexec._release(first)
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run(main())
+
+    # higher priority first, then larger tasks first, a smaller task fills the node left by a task that does not fit
+    assert order == ['urgent', 'large', 'small', 'medium']
+    assert mpiexec._used[False] == [0, 0, 0]
+    assert mpiexec._totals == [0, 0, 0, 0]
+    assert max(sample[2] for sample in mpiexec._samples) == 8
+    assert len(mpiexec._pending[False]) == 0 and len(mpiexec._running[False]) == 0
+
+
+def test_memory(workspace, monkeypatch):
+    from nnodes.job import Slurm, Andes, Traverse, Summit, LocalMPI
+
+    # memory limit is passed to every job system that supports it
+    for cls, opt in ((Slurm, '--mem-per-cpu 500'), (Andes, '--mem-per-cpu 500'),
+        (Traverse, '--mem-per-cpu 500'), (Summit, '--memory_per_rs 1000')):
+        job = cls({'nnodes': 1, 'walltime': 10, 'cpus_per_node': 32, 'gpus_per_node': 0}, [])
+        monkeypatch.setitem(root.__dict__, '_job', job)
+        assert opt in mpiexec.getcmd('a.out', 4, 2, 0, None, 1000, False, None)
+        assert opt not in mpiexec.getcmd('a.out', 4, 2, 0, None, None, False, None)
+
+    monkeypatch.setitem(root.__dict__, '_job', LocalMPI({'nnodes': 1, 'walltime': 10}, []))
+
+    with pytest.raises(ValueError):
+        mpiexec.getcmd('a.out', 4, 2, 0, None, 1000, False, None)
+
+    # tasks that share a node are limited by memory
+    monkeypatch.setattr(root.job, 'cpus_per_node', 4)
+    monkeypatch.setattr(root.job, 'memory_per_node', 1000)
+    monkeypatch.setattr(root.job, 'node_splittable', True)
+    res = mpiexec.getresource(1, 1, 0, None, 600, False)
+    assert res == (Fraction(1, 4), 0, Fraction(3, 5))
+    running = []
+    peak = []
+
+    async def task():
+        fut = await mpiexec._acquire(res, 0)
+        running.append(fut)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(fut)
+        mpiexec._release(fut)
+
+    async def main():
+        await asyncio.gather(task(), task())
+
+    asyncio.run(main())
+
+    assert peak == [1, 1] and mpiexec._used[False] == [0, 0, 0]
+
+
+def test_multiprocessing_limit(workspace):
+    running = []
+    peak = []
+
+    async def task(n):
+        fut = await mpiexec._acquire(n, 0)
+        running.append(n)
+        peak.append(sum(running))
+        await asyncio.sleep(0.01)
+        running.remove(n)
+        mpiexec._release(fut)
+
+    async def main():
+        await asyncio.gather(*(task(n) for n in (2, 3, 1, 4, 2)))
+
+    asyncio.run(main())
+
+    assert max(peak) <= root.job.mp_nprocs_max
+    assert mpiexec._used[True] == [0]
+
+
+def test_restart_file(workspace, monkeypatch):
+    cp = {'file': 'solver.chk'}
+    root.write('step 5', 'a/solver.chk')
+    root.add_mpi('echo $NNODES_RESTART > restarted', name='a', cwd='a', use_multiprocessing=False, checkpoint=cp)
+    run(monkeypatch)
+
+    # restart file is removed after the task finished
+    assert root.done and root.read('a/restarted').strip() == path.join(workspace, 'a', 'solver.chk')
+    assert not root.has('a/solver.chk')
+
+    # restart file of an unfinished task is removed when the task is reset
+    root.reset()
+    root.add_mpi('exit 1', name='b', cwd='b', use_multiprocessing=False, checkpoint=cp)
+    root.write('step 5', 'b/solver.chk')
+    root.reset()
+    assert not root.has('b/solver.chk')
+
+    with pytest.raises(ValueError):
+        root.add_mpi('true', checkpoint=cp, speculative=0.5)
+
+
+def test_drain_status(workspace, monkeypatch):
+    monkeypatch.setattr(type(root.job), 'inqueue', property(lambda _: True))
+    node = root.add_mpi('true', name='running', use_multiprocessing=False)
+    node._starttime = node._dispatchtime = 1.0
+    root._drain()
+
+    # running tasks continue while draining
+    assert root.job._draining and not root.job.paused
+    assert 'terminated' not in str(node)
+
+    # interrupted by the walltime signal
+    monkeypatch.setattr(type(root.job), 'requeue', lambda _: None)
+    root.job._draining = False
+    root._signal()
+    assert str(node) == 'running (terminated)'
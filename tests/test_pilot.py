@@ -0,0 +1,112 @@
+import asyncio
+from os import makedirs, utime
+from time import time
+from fractions import Fraction
+
+from nnodes import root, lease, pilot
+
+
+def setup(monkeypatch):
+    """Enable pilot mode with a fake scheduler, returns the commands submitted and the job ids cancelled."""
+    submitted = []
+    cancelled = []
+    monkeypatch.setattr(root.job, 'pilot_nnodes', 2)
+    monkeypatch.setattr(root.job, 'pilot_max', 2)
+    monkeypatch.setattr(root.job, 'submit', lambda cmd, *_: (submitted.append(cmd), str(len(submitted)))[1])
+    monkeypatch.setattr(root.job, 'cancel', cancelled.append)
+    monkeypatch.setattr(pilot, '_pilots', {})
+    monkeypatch.setattr(pilot, '_interval', 0.01)
+    monkeypatch.setattr(lease, '_waiting', {})
+    root._init['lease_dir'] = 'lease'
+
+    for sub in lease._subdirs:
+        makedirs(lease._path(sub))
+
+    return submitted, cancelled
+
+
+def wait(res, submitted=0.0):
+    """Entry of a task waiting in lease directory."""
+    return [None, None, False, res, submitted]
+
+
+def scale():
+    """Make scaling decisions for a short period."""
+    async def main():
+        try:
+            await asyncio.wait_for(pilot._scale(), 0.1)
+
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(main())
+
+
+def test_demand(workspace, monkeypatch):
+    setup(monkeypatch)
+
+    # 1 and 2 nodes, 2 of 4 processes, tasks that are larger than a worker allocation or submitted recently are ignored
+    lease._waiting.update({'1': wait((Fraction(1),) * 3), '2': wait((Fraction(2),) * 3), '3': wait(2),
+        '4': wait((Fraction(3),) * 3), '5': wait(8), '6': wait((Fraction(2),) * 3, time() + 60)})
+    assert pilot._demand() == 2
+
+    lease._waiting['1'][2] = True
+    assert pilot._demand() == 2
+
+    lease._waiting['3'][2] = True
+    assert pilot._demand() == 1
+
+
+def test_state(workspace, monkeypatch):
+    setup(monkeypatch)
+    assert pilot._state('pilot.1') == 'queued'
+
+    root.write('', lease._path('pilots', 'pilot.1'))
+    assert pilot._state('pilot.1') == 'running'
+
+    # worker stopped renewing its file
+    utime(lease._path('pilots', 'pilot.1'), (time() - 600, time() - 600))
+    assert pilot._state('pilot.1') == 'exited'
+
+    root.write('', lease._path('pilots', 'pilot.2'))
+    root.write('', lease._path('pilots', 'pilot.2.exit'))
+    assert pilot._state('pilot.2') == 'exited'
+
+
+def test_scale(workspace, monkeypatch):
+    submitted, cancelled = setup(monkeypatch)
+    lease._waiting.update({str(i): wait((Fraction(2),) * 3) for i in range(3)})
+
+    # number of allocations is limited by job.pilot_max, queued allocations are not submitted again
+    scale()
+    assert len(submitted) == 2 and len(pilot._pilots) == 2 and cancelled == []
+    assert all('-m nnodes.scripts.nnwork --nnodes 2' in cmd for cmd in submitted)
+
+    # queued allocation is cancelled if no task is pending, running allocation exits by itself
+    pilots = dict(pilot._pilots)
+    running, queued = pilots
+    root.write('', lease._path('pilots', running))
+    lease._waiting.clear()
+    scale()
+    assert cancelled == [pilots[queued]] and list(pilot._pilots) == [running]
+
+    # exited allocation is no longer tracked
+    root.write('', lease._path('pilots', f'{running}.exit'))
+    scale()
+    assert pilot._pilots == {} and not root.has(lease._path('pilots', running))
+
+
+def test_stop(workspace, monkeypatch):
+    submitted, cancelled = setup(monkeypatch)
+    lease._waiting['1'] = wait((Fraction(2),) * 3)
+
+    async def main():
+        pilot.start()
+        await asyncio.sleep(0.1)
+        pilot.stop()
+
+    asyncio.run(main())
+
+    # queued allocation is cancelled when the workflow exits
+    assert len(submitted) == 1 and cancelled == ['1']
+    assert pilot._pilots == {} and pilot._background is None
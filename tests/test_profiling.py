@@ -0,0 +1,33 @@
+import asyncio
+
+from nnodes import root
+from nnodes.profiling import profile
+
+
+def work():
+    """Synchronous task."""
+    return sum(range(1000))
+
+
+async def work_async():
+    """Coroutine task."""
+    await asyncio.sleep(0)
+
+
+def test_profile_sync_only(workspace):
+    root._init['profiler'] = 'cprofile'
+    root.add(work, name='sync')
+    root.add(work_async, name='async')
+    asyncio.run(root.execute())
+
+    assert root.done
+    assert root.has('sync.prof') and not root.has('async.prof')
+
+
+def test_nested_profile(workspace, capsys):
+    with profile('cprofile', 'outer'):
+        with profile('cprofile', 'inner'):
+            work()
+
+    assert 'warning: inner is not profiled' in capsys.readouterr().out
+    assert root.has('outer.prof') and not root.has('inner.prof')
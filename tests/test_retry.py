@@ -0,0 +1,74 @@
+import errno
+import asyncio
+
+from nnodes import root
+from nnodes.retry import getfailure, getpolicy, TRANSIENT, FATAL
+
+
+def classify_custom(err, node):
+    """Classify ValueError as fatal."""
+    return FATAL if isinstance(err, ValueError) else None
+
+
+def fail(node):
+    """Task that always fails."""
+    node.count = (node.count or 0) + 1
+    raise node.error
+
+
+def test_policy_selection(workspace):
+    root._init['default_retry'] = 1
+    root._init['retry_delay'] = 2
+    root._init['retry_policy'] = {TRANSIENT: {'retry': 5}, 'custom': {'retry': 4, 'delay': 3}}
+    node = root.add(None)
+
+    # unclassified failures use root.default_retry and root.retry_delay
+    assert (p := getpolicy(None, node)).retry == 1 and p.delay == 2
+
+    # default policies are updated by root.retry_policy
+    assert (p := getpolicy(TRANSIENT, node)).retry == 5 and p.delay == 10 and p.backoff == 2
+    assert getpolicy(FATAL, node).retry == 0
+    assert (p := getpolicy('custom', node)).retry == 4 and p.delay == 3
+
+    # retry of a node applies to every class except fatal failures
+    node = root.add(None, retry=7)
+    assert [getpolicy(f, node).retry for f in (None, TRANSIENT, FATAL, 'custom')] == [7, 7, 0, 7]
+    assert getpolicy(TRANSIENT, node).delay == 10
+
+    # fatal failures are only retried if allowed by root.retry_policy
+    root._init['retry_policy'] = {FATAL: {'retry': 2}}
+    assert getpolicy(FATAL, node).retry == 2
+
+
+def test_classify(workspace):
+    node = root.add(None)
+    assert getfailure(OSError(errno.ESTALE, 'stale'), node) == TRANSIENT
+    assert getfailure(RuntimeError('srun: Job step creation temporarily disabled'), node) == TRANSIENT
+    assert getfailure(TypeError(), node) == FATAL
+    assert getfailure(ValueError(), node) is None
+
+    root._init['retry_classifiers'] = [['test_retry', 'classify_custom']]
+    assert getfailure(ValueError(), node) == FATAL
+
+
+def test_fatal_abort(workspace):
+    # fatal failure runs once and aborts the job, even if the node allows retries
+    node = root.add(fail, error=TypeError('fatal'), retry=3)
+    asyncio.run(root.execute())
+    assert node.count == 1 and root.job.aborted
+
+    # failure classified by the user
+    root.reset()
+    root._init['retry_classifiers'] = [['test_retry', 'classify_custom']]
+    node = root.add(fail, error=ValueError('fatal'))
+    root._starttime = None
+    asyncio.run(root.execute())
+    assert node.count == 1 and root.job.aborted
+
+    # unclassified failure is retried and the job can be requeued
+    root.reset()
+    root._init['retry_delay'] = 0
+    node = root.add(fail, error=RuntimeError('flaky'), retry=1)
+    root._starttime = None
+    asyncio.run(root.execute())
+    assert node.count == 2 and root.job.failed and not root.job.aborted
@@ -0,0 +1,117 @@
+import sys
+import threading
+from os import getpid
+from time import time, sleep
+
+from nnodes import root, mpiexec, node as node_module
+from nnodes.root import Root
+
+from conftest import reinit
+
+# module of Root (nnodes.root is shadowed by the root node)
+root_module = sys.modules[Root.__module__]
+
+
+def wait_saved():
+    """Wait until the background save thread exits."""
+    for _ in range(100):
+        if root_module._saving_in_thread is None:
+            return
+
+        sleep(0.05)
+
+
+def test_save_after_writer_failure(workspace, capsys):
+    root.add(None, name='a')
+    root.lock = threading.Lock()
+    root.save(True)
+    wait_saved()
+
+    # failure is reported and the writer thread is released
+    assert 'cannot pickle' in capsys.readouterr().err
+    assert root_module._saving_in_thread is None
+
+    del root._data['lock']
+    root.add(None, name='b')
+    root.save(True)
+    wait_saved()
+
+    restored = Root('.', {}, None)
+    restored.init()
+    assert [node.name for node in restored] == ['a', 'b']
+
+
+def test_generation(workspace, monkeypatch):
+    group = root.add(None, name='group')
+    child = group.add(None, name='child', value=1)
+
+    for node in (group, child):
+        node._starttime = 0.0
+        node._endtime = 1.0
+
+    root.save()
+    reinit()
+
+    # finished subtree is restored lazily
+    assert root[0]._lazy is not None
+
+    saves = []
+    save = Root.save
+    monkeypatch.setattr(Root, 'save', lambda self, *args: (saves.append(node_module._generation), save(self)))
+    root.save()
+
+    # runtime attributes do not trigger a save
+    generation = node_module._generation
+    root[0]._executing = None
+    root[0]._flags = None
+    root.checkpoint()
+    assert node_module._generation == generation and len(saves) == 1
+
+    # change of a nested node in a lazily loaded subtree is saved
+    root[0][0].value = 2
+    assert node_module._generation > generation
+    root.checkpoint()
+    assert len(saves) == 2
+
+    root.checkpoint()
+    assert len(saves) == 2
+
+    reinit()
+    assert root[0][0].value == 2
+
+
+def test_heartbeat(workspace, monkeypatch):
+    monkeypatch.setattr(root_module, '_heartbeat', (None, 0.0))
+    monkeypatch.setitem(mpiexec._running[False], object(), None)
+
+    # heartbeat is disabled
+    root._beat()
+    assert not root.has('heartbeat.json') and root.heartbeat() is None
+
+    root._init['ping_interval'] = 60
+    root._beat()
+    beat = root.load('heartbeat.json')
+    assert beat['pid'] == getpid() and beat['running'] == 1 and beat['pending'] == 0
+    assert not root.has('_heartbeat.json')
+
+    # heartbeat is read at most every second
+    assert root.heartbeat() is None
+    monkeypatch.setattr(root_module, '_heartbeat', (None, 0.0))
+    assert root.heartbeat() == beat
+
+    # running task of a workflow that stopped writing heartbeats
+    node = root.add(None, name='task')
+    node._starttime = 1.0
+    beat['time'] = time() - 3600
+    root.dump(beat, 'heartbeat.json')
+    monkeypatch.setattr(root_module, '_heartbeat', (None, 0.0))
+    assert str(node) == 'task (not running)'
+
+    root._beat()
+    monkeypatch.setattr(root_module, '_heartbeat', (None, 0.0))
+    assert str(node).startswith('task (running - ')
+
+    # partially written or missing file
+    root.write('{', 'heartbeat.json')
+    monkeypatch.setattr(root_module, '_heartbeat', (None, 0.0))
+    assert root.heartbeat() is None
@@ -0,0 +1,93 @@
+import socket
+import asyncio
+
+import pytest
+
+from nnodes import root, status
+
+from conftest import reinit
+
+
+async def request():
+    """Get status from the status server of current workflow."""
+    reply = await asyncio.to_thread(lambda: next(status.request(root.path(root.status_socket))))
+    root.write(reply['stat'][0], 'reply')
+
+
+def interrupt():
+    """Task that stops the workflow."""
+    raise KeyboardInterrupt
+
+
+def test_stale_socket(workspace):
+    root._init['status_socket'] = 'status.sock'
+
+    # socket of a killed workflow process
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind('status.sock')
+    sock.close()
+
+    root.add(request)
+    asyncio.run(root.execute())
+    assert root.done and root.read('reply').startswith('test_stale_socket0')
+    assert not root.has('status.sock')
+
+
+def test_socket_error(workspace, capsys):
+    root._init['status_socket'] = 'x' * 200
+    root.add(None, name='child')
+    asyncio.run(root.execute())
+    assert root.done and 'warning: cannot serve status' in capsys.readouterr().out
+
+
+def test_stop_on_error(workspace):
+    root._init['status_socket'] = 'status.sock'
+    root.add(interrupt)
+
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(root.execute())
+
+    assert status._server is None and not root.has('status.sock')
+
+
+def test_stat_filter(workspace):
+    done = root.add(None, name='done')
+
+    for i in range(3):
+        step = done.add(None, name=f'step{i}')
+        step._starttime, step._endtime = 1.0, 11.0
+
+    done._starttime, done._endtime = 1.0, 31.0
+    group = root.add(None, name='group')
+    group.add(None, name='a')._endtime = 1.0
+    b = group.add(None, name='b')
+    c = group.add(None, name='c')
+    d = group.add(None, name='d')
+    group.add(None, name='e')
+    root.add(None, name='f')
+    root._starttime = group._starttime = b._starttime = c._starttime = d._starttime = 1.0
+    b._err = RuntimeError('failed')
+    c._is_mpi = d._is_mpi = True
+    d._dispatchtime = 1.0
+    root.save()
+    reinit()
+
+    # only nodes in given states and their parent nodes are printed
+    assert root.stat(only=['failed']).split('\n')[1:] == ['1) group', '  1) b (failed)']
+    lines = root.stat(only=['pending', 'running']).split('\n')[1:]
+    assert lines[:2] == ['1) group', '  2) c (pending)'] and lines[2].startswith('  3) d (running - ')
+    assert root.stat(only=['cancelled']).split('\n')[1:] == []
+
+    # finished subtree is not restored to filter nodes
+    assert root[0]._lazy is not None
+
+    # number of child nodes and depth are limited
+    lines = root.stat(True, width=2).split('\n')[1:]
+    assert lines[:4] == ['0) done (01:00)', '  0) step0 (00:10)', '  1) step1 (00:10)', '  ... 1 more']
+    assert lines[4].startswith('1) group (running - ')
+    assert lines[5:] == ['  0) a', '  1) b (failed)', '  ... 3 more', '... 1 more']
+    assert [line.split(' ')[1] for line in root.stat(True, depth=1).split('\n')[1:]] == ['done', 'group', 'f']
+    assert root.stat(only=['failed'], width=1).split('\n')[1:] == ['1) group', '  1) b (failed)']
+
+    # lines are yielded in the same order by iterstat
+    assert list(root.iterstat(only=['failed'])) == root.stat(only=['failed']).split('\n')
@@ -0,0 +1,27 @@
+from nnodes import root
+from nnodes.trace import nodeid
+
+
+def test_nodeid_after_reset(workspace):
+    a = root.add(None, name='a')
+    b = root.add(None, name='b')
+    c = b.add(None, name='c')
+    assert [nodeid(n) for n in (root, a, b, c)] == ['', '0', '1', '1/0']
+
+    # indices are updated after child nodes are replaced
+    root.reset()
+    b2 = root.add(None, name='b')
+    c2 = b2.add(None, name='c')
+    d = b2.add(None, name='d')
+    assert [nodeid(n) for n in (b2, c2, d)] == ['0', '0/0', '0/1']
+
+    # node removed from the tree keeps its last id
+    assert nodeid(c) == '1/0'
+
+    # archived child nodes are restored as new objects
+    for n in (c2, d, b2):
+        n._starttime, n._endtime = 0.0, 1.0
+
+    b2.archive()
+    b2.unarchive()
+    assert [nodeid(n) for n in b2] == ['0/0', '0/1']